@@ -1,6 +1,9 @@
+from array import array
+import json
 import math
 from Game.util import *
 from Game.game import *
+from AI_Players.patterns import *
 
 
 # ===============================================================================================================
@@ -9,10 +12,25 @@ from Game.game import *
 class Evaluator:
     """
         Interface for evaluator classes.
+        antisymmetric: True if eval(game, 1) == -eval(game, 2) for every game.
     """
-    def eval(self, board, player):
+    antisymmetric = False
+
+    def eval(self, game, player):
         pass
 
+    def eval_to_move(self, game):
+        """
+            Returns the score of game for the player to move, the way the search scores its leaves.
+            The score is antisymmetric (with the other player to move it would be negated), so it's
+            the same whichever player searches. Evaluators that aren't antisymmetric themselves are
+            averaged over both players' points of view.
+        """
+        player = game.current_player
+        if self.antisymmetric:
+            return self.eval(game, player)
+        return (self.eval(game, player) - self.eval(game, 3 - player)) / 2
+
 
 class StaticEvaluator(Evaluator):
     """
@@ -20,53 +38,49 @@ class StaticEvaluator(Evaluator):
         the same formula at all stages of the game.
         The formula uses three values that are calculated based of the game state.
     """
-    def eval(self, board, player):
+    antisymmetric = True
+
+    def eval(self, game, player):
         """
             The formula for the evaluation of game state.
         """
-        return 2 * self.mobility_evaluation(board, player) + self.disc_difference(board, player) + 1000 * self.corners_evaluation(board, player)
+        return 2 * self.mobility_evaluation(game, player) + self.disc_difference(game, player) + 1000 * self.corners_evaluation(game, player)
     
-    def mobility_evaluation(self, board, player):
+    def mobility_evaluation(self, game, player):
         """
             This calculates the mobility of the game state.
             The mobility is a value that represents the player's possible moves vs. the opponent's possible moves.
         """
         other_player = 1 if player == 2 else 2
-        player_moves_count = len(get_possible_moves(board, player))
-        other_player_moves_count = len(get_possible_moves(board, other_player))
+        player_moves_count = game.get_move_count(player)
+        other_player_moves_count = game.get_move_count(other_player)
         return 100 * (player_moves_count - other_player_moves_count) / (player_moves_count + other_player_moves_count + 1)
 
-    def disc_difference(self, board, player):
+    def disc_difference(self, game, player):
         """
             This calculates state's disc difference between the players.
         """
         other_player = 1 if player == 2 else 2
-        game = Game(board)
         player_disc_count = game.player_disk_count(player)
         other_player_disc_count = game.player_disk_count(other_player)
         return 100 * (player_disc_count - other_player_disc_count) / (player_disc_count + other_player_disc_count)
 
-    def corners_evaluation(self, board, player):
+    def corners_evaluation(self, game, player):
         """
             This calculates the state's value based of corners captured by each player.
         """
         other_player = 1 if player == 2 else 2
-        player_corners = 0
-        other_player_corners = 0
-        for i, j in corners:
-            if board[i][j] == player:
-                player_corners += 1
-            elif board[i][j] == other_player:
-                other_player_corners += 1
+        player_corners = popcount(game.bitboards[player] & CORNERS_MASK)
+        other_player_corners = popcount(game.bitboards[other_player] & CORNERS_MASK)
         return 100 * (player_corners - other_player_corners) / (player_corners + other_player_corners + 1)
     
-    def remainder_evaluation(self, board):
+    def remainder_evaluation(self, game):
         """
             This method predicts who is supposed to place the last disc given current state's remaining
             empty squares.
             If the amount of remaining squares is even, the function returns -1, otherwise it returns 1.
         """
-        remainder = 64 - Game(board).get_total_disk_count()
+        remainder = 64 - game.get_total_disk_count()
         return -1 if remainder % 2 == 0 else 1
 
 
@@ -74,41 +88,64 @@ class DynamicEvaluator(StaticEvaluator):
     """
         This is a dynamic evaluator that uses the evaluation methods inherited from the static evaluator, but
         uses a dynamic formula that calculates the game state value based on the current stage of the game.
+        The remainder evaluation is the same for both players, so this evaluator isn't antisymmetric.
     """
-    def eval(self, board, player):
-        game = Game(board)
+    antisymmetric = False
+
+    def eval(self, game, player):
         if game.is_game_over():
-            return 1000 * self.disc_difference(board, player)
+            return 1000 * self.disc_difference(game, player)
         disc_count = game.get_total_disk_count()
         
         if disc_count < 20:
-            return (1000 * self.corners_evaluation(board, player) +
-                    50 * self.mobility_evaluation(board, player))
+            return (1000 * self.corners_evaluation(game, player) +
+                    50 * self.mobility_evaluation(game, player))
         elif disc_count < 59:
-            return (1000 * self.corners_evaluation(board, player) +
-                    20 * self.mobility_evaluation(board, player) +
-                    10 * self.disc_difference(board, player) +
-                    100 * self.remainder_evaluation(board))
+            return (1000 * self.corners_evaluation(game, player) +
+                    20 * self.mobility_evaluation(game, player) +
+                    10 * self.disc_difference(game, player) +
+                    100 * self.remainder_evaluation(game))
         else:
-            return (1000 * self.corners_evaluation(board, player) +
-                    100 * self.mobility_evaluation(board, player) +
-                    500 * self.disc_difference(board, player) +
-                    500 * self.remainder_evaluation(board))
+            return (1000 * self.corners_evaluation(game, player) +
+                    100 * self.mobility_evaluation(game, player) +
+                    500 * self.disc_difference(game, player) +
+                    500 * self.remainder_evaluation(game))
 
 
 class RealtimeEvaluator(StaticEvaluator):
     """
         This evaluator uses a set of weights to calculate a formula that gets updated in realtime
         to get a more accurate value of a game state.
+        The corner grab possibility is only the player's own, so this evaluator isn't antisymmetric.
     """
-    def __init__(self):
+    antisymmetric = False
+
+    def __init__(self, weights_path=None):
+        self.weights_list = weights_list
+        self.timings_list = timings_list
+        if weights_path:
+            self.load_weights(weights_path)
         self.set_weights_for_disc_counts()
 
+    def load_weights(self, path):
+        """
+            Loads weights_list and timings_list from a json file, like the one written by
+            AI_Players.weight_fitting, instead of the ones defined in Game.util.
+        """
+        with open(path) as f:
+            weights = json.load(f)
+        if len(weights["weights_list"]) != len(weights["timings_list"]):
+            raise ValueError(f"{path} doesn't have a list of weights for every timing.")
+        self.weights_list = weights["weights_list"]
+        self.timings_list = weights["timings_list"]
+
     def set_weights_for_disc_counts(self):
         """
             This method creates the list of weights to be used by the evaluator based of amount
             of discs placed on the game's board to help define the realtime formula for each state.
         """
+        weights_list = self.weights_list
+        timings_list = self.timings_list
         # initialize a list of lists of weights to be used for each disc count during the game
         self.weights_for_disc_count = []
 
@@ -133,201 +170,662 @@ class RealtimeEvaluator(StaticEvaluator):
                 current_weights.append(round(factor * weights_list[weight][i] + (1 - factor) * weights_list[weight - 1][i]))
             self.weights_for_disc_count.append(current_weights)
     
-    def eval(self, board, player):
+    def eval(self, game, player):
         """
             This calculates the state's value using a realtime formula based of the weights corresponding to state's
             disc count in the list of weights.
             The formula uses some evaluation methods inherited from static evaluator plus several other methods that
             realtime evaluator defines: frontier_evaluation, placement_evaluation, stability_evaluation and
             corner_grab_possibility.
+            All six values are calculated here in one go from the game's bitboards and cached moves, and the
+            result is exactly the same as adding up the weighted evaluation methods.
         """
-        game = Game(board)
-        disc_count = game.get_total_disk_count()
+        other_player = 1 if player == 2 else 2
+        own, opp = game.bitboards[player], game.bitboards[other_player]
+        empty = ~(own | opp) & FULL_MASK
+        player_moves = game.moves[player]
+        weights = self.weights_for_disc_count[64 - game.empty_count]
+
+        player_moves_count = popcount(player_moves)
+        other_player_moves_count = popcount(game.moves[other_player])
+        mobility = 100 * (player_moves_count - other_player_moves_count) / (player_moves_count + other_player_moves_count + 1)
+
+        player_frontier_count = popcount(get_frontier_mask(opp, empty))
+        other_player_frontier_count = popcount(get_frontier_mask(own, empty))
+        frontier = (
+            100 *
+            (player_frontier_count - other_player_frontier_count) /
+            (player_frontier_count + other_player_frontier_count + 1)
+        )
+
+        player_disc_count = popcount(own)
+        other_player_disc_count = popcount(opp)
+        disc_difference = 100 * (player_disc_count - other_player_disc_count) / (player_disc_count + other_player_disc_count)
 
-        weights = self.weights_for_disc_count[disc_count]
+        placement = 0
+        for weight, mask in square_weight_masks:
+            placement += weight * (popcount(own & mask) - popcount(opp & mask))
 
-        return (weights[0] * self.mobility_evaluation(board, player) +
-                weights[1] * self.frontier_evaluation(board, player) +
-                weights[2] * self.disc_difference(board, player) +
-                weights[3] * self.placement_evaluation(board, player) +
-                weights[4] * self.stability_evaluation(board, player) +
-                weights[5] * self.corner_grab_possibility(board, player)
+        full_lines = get_full_lines(own | opp)
+        player_stable_discs_count = popcount(get_stable_mask(own, opp, full_lines))
+        other_player_stable_discs_count = popcount(get_stable_mask(opp, own, full_lines))
+        stability = (
+            100 *
+            (player_stable_discs_count - other_player_stable_discs_count) /
+            (player_stable_discs_count + other_player_stable_discs_count + 1)
+        )
+
+        corner_grab = 100 if player_moves & CORNERS_MASK else 0
+
+        return (weights[0] * mobility +
+                weights[1] * frontier +
+                weights[2] * disc_difference +
+                weights[3] * placement +
+                weights[4] * stability +
+                weights[5] * corner_grab
             )
     
-    def frontier_evaluation(self, board, player):
+    def eval_to_move(self, game):
+        """
+            Same as Evaluator.eval_to_move, with one evaluation: corner grab possibility is the only
+            value of the formula that isn't antisymmetric, so its term is replaced by half the
+            difference between the players' corner grab possibilities.
+        """
+        player = game.current_player
+        weights = self.weights_for_disc_count[64 - game.empty_count]
+        corner_grabs = bool(game.moves[player] & CORNERS_MASK) + bool(game.moves[3 - player] & CORNERS_MASK)
+        return self.eval(game, player) - 50 * weights[5] * corner_grabs
+
+    def get_features(self, game, player):
+        """
+            Returns the six values the formula weighs, in the order of the weights in weights_list.
+        """
+        return [
+            self.mobility_evaluation(game, player),
+            self.frontier_evaluation(game, player),
+            self.disc_difference(game, player),
+            self.placement_evaluation(game, player),
+            self.stability_evaluation(game, player),
+            self.corner_grab_possibility(game, player),
+        ]
+
+    def frontier_evaluation(self, game, player):
         """
             The frontier is the number of empty squares adjacent to opponent's squares, which represents the
             potential mobility of the player.
             The value is player's frontier in relation to the opponent's frontier.
         """
         other_player = 1 if player == 2 else 2
-        player_frontier = get_frontier_squares(board, other_player)
-        other_player_frontier = get_frontier_squares(board, player)
+        own, opp = game.bitboards[player], game.bitboards[other_player]
+        empty = ~(own | opp) & FULL_MASK
+        player_frontier_count = popcount(get_frontier_mask(opp, empty))
+        other_player_frontier_count = popcount(get_frontier_mask(own, empty))
 
         return (
             100 *
-            (len(player_frontier) - len(other_player_frontier)) /
-            (len(player_frontier) + len(other_player_frontier) + 1)
+            (player_frontier_count - other_player_frontier_count) /
+            (player_frontier_count + other_player_frontier_count + 1)
         )
     
-    def placement_evaluation(self, board, player):
+    def placement_evaluation(self, game, player):
         """
             Each square on the board has a value that represents its strength vs. weakness.
             The value is calculated by calculating the value of player's captured squares in relation to the
             value of the opponent's captured squares.
         """
         other_player = 1 if player == 2 else 2
-        player_placement_value = 0
-        other_player_placement_value = 0
-        for i in range(8):
-            for j in range(8):
-                if board[i][j] == player:
-                    player_placement_value += square_static_weights[i][j]
-                elif board[i][j] == other_player:
-                    other_player_placement_value += square_static_weights[i][j]
-        return player_placement_value - other_player_placement_value
+        own, opp = game.bitboards[player], game.bitboards[other_player]
+        placement = 0
+        for weight, mask in square_weight_masks:
+            placement += weight * (popcount(own & mask) - popcount(opp & mask))
+        return placement
     
-    def stability_evaluation(self, board, player):
+    def stability_evaluation(self, game, player):
         """
             Calculates the number of stable squares captured by player in relation to number of stable squares
             captured by the opponent.
-            Stable squares are squares that cannot be recaptured.
+            Stable squares are squares that cannot be recaptured, see get_stable_mask in Game.bitboard.
         """
         other_player = 1 if player == 2 else 2
-        player_stable_discs_count = len(get_stable_discs(board, player))
-        other_player_stable_discs_count = len(get_stable_discs(board, other_player))
+        own, opp = game.bitboards[player], game.bitboards[other_player]
+        full_lines = get_full_lines(own | opp)
+        player_stable_discs_count = popcount(get_stable_mask(own, opp, full_lines))
+        other_player_stable_discs_count = popcount(get_stable_mask(opp, own, full_lines))
         return (
             100 *
             (player_stable_discs_count - other_player_stable_discs_count) /
             (player_stable_discs_count + other_player_stable_discs_count + 1)
         )
     
-    def corner_grab_possibility(self, board, player):
+    def corner_grab_possibility(self, game, player):
         """
             A value representing if the state allows the player to capture a corner.
             Value is 100 if yes and 0 if not.
         """
-        moves = list(get_possible_moves(board, player).keys())
-        for move in moves:
-            if move in corners:
-                return 100
+        if game.get_moves_mask(player) & CORNERS_MASK:
+            return 100
         return 0
 
 
+class PatternEvaluator(Evaluator):
+    """
+        This evaluator scores a game state by looking up the discs on patterns of squares (edges, corners,
+        diagonals and rows, see AI_Players.patterns) in tables of weights, one set of tables for each phase
+        of the game.
+        The score of white is the negation of black's, so the evaluator is antisymmetric.
+        The pattern indexes are kept up to date by a tracker attached to the game, so an evaluation is just
+        one table lookup per pattern.
+        weights_path: a file written by save_pattern_weights. Without it the tables are seeded from
+                      square_static_weights, and every phase shares the same tables (see
+                      get_default_tables), so the evaluation doesn't change with the phase until
+                      fitted weights are given.
+    """
+    antisymmetric = True
+
+    def __init__(self, weights_path=None):
+        if weights_path:
+            self.weights = load_pattern_weights(weights_path)
+        else:
+            self.weights = [get_default_tables()] * phase_count
+        self.set_instance_tables()
+
+    def set_instance_tables(self):
+        """
+            Lists the table of every pattern instance for each phase, so eval can zip them with the indexes.
+        """
+        self.instance_tables = [
+            [tables[pattern] for pattern in instance_patterns] for tables in self.weights
+        ]
+
+    def get_indexes(self, game):
+        """
+            Returns the pattern indexes of the game, attaching a tracker to it on the first call.
+        """
+        tracker = game.get_tracker("patterns")
+        if tracker is None:
+            tracker = PatternIndexes()
+            game.add_tracker("patterns", tracker)
+        return tracker.indexes
+
+    def eval(self, game, player):
+        indexes = self.get_indexes(game)
+        tables = self.instance_tables[get_phase(64 - game.empty_count)]
+        score = sum([table[index] for table, index in zip(tables, indexes)])
+        return score if player == 1 else -score
+
+
+# ==============================================================================================
+# ------------------------- Helpers for the Min-Max algorithm ----------------------------------
+# ----------------------------------------------------------------------------------------------
+
+# Scores of games with a known result are pushed past the range of every evaluator, so the
+# search always prefers a won game to any heuristic score and always avoids a lost one.
+win_score = 10 ** 7
+
+# Raised by the search when the time budget of the move runs out.
+class SearchTimeout(RuntimeError): ...
+
+
+def get_game_over_score(game, player):
+    """
+        Returns the score of a finished game for player, based on the final disc difference.
+    """
+    other_player = 1 if player == 2 else 2
+    disc_difference = game.player_disk_count(player) - game.player_disk_count(other_player)
+    if disc_difference > 0:
+        return win_score + disc_difference
+    if disc_difference < 0:
+        return -win_score + disc_difference
+    return 0
+
+def get_stability_score(game, player):
+    """
+        Checks if the result of the game is already decided by stable discs (see get_stable_mask in
+        Game.bitboard): if a player is sure to end the game with more than half of the board.
+        Returns the score of the decided game for player, or None if the result isn't decided.
+        A player needs more than 32 discs for that, so most positions are ruled out without
+        calculating stability.
+    """
+    other_player = 1 if player == 2 else 2
+    own, opp = game.bitboards[player], game.bitboards[other_player]
+    if popcount(own) <= 32 and popcount(opp) <= 32:
+        return None
+    lower, upper = get_final_score_bounds(own, opp)
+    if lower > 0:
+        return win_score + lower
+    if upper < 0:
+        return -win_score + upper
+    return None
+
+
+# ==============================================================================================
+# ------------------------------- Transposition table ------------------------------------------
+# ----------------------------------------------------------------------------------------------
+
+# Bound types of transposition table entries. An empty slot has the type 0.
+exact_bound = 1
+lower_bound = 2
+upper_bound = 3
+
+# Bytes of one entry: the key (8), depth (1), bound type (1), score (8), best move (1) and age (1).
+tt_entry_size = 20
+
+
+class TranspositionTable:
+    """
+        A hash table of searched positions, so positions reached through different move orders
+        are only searched once.
+        The entries are stored in preallocated arrays, one array for each field, so the table
+        never grows past its size.
+        The table is split into buckets of two slots, indexed by the low bits of the position's
+        hash. The first slot keeps the deepest search of the bucket, the second slot always takes
+        the newest entry that isn't deep enough for the first one.
+        The table can be kept from one search to the next: new_age starts a new search, and an
+        entry stored by an earlier search is still found, but it gives up the first slot of its
+        bucket to any entry of the current search.
+        size_mb: the memory the entries take, in megabytes.
+        Counters: probes, hits (probes that found the position), stores and collisions (stores
+        that wrote over another position's entry).
+    """
+    def __init__(self, size_mb=16):
+        buckets = 1
+        while 4 * buckets * tt_entry_size <= size_mb * 2 ** 20:
+            buckets *= 2
+        self.bucket_mask = buckets - 1
+        self.size = 2 * buckets
+        self.clear()
+
+    def clear(self):
+        """
+            Empties the table and resets the counters.
+        """
+        size = self.size
+        self.keys = array('Q', bytes(8 * size))
+        self.depths = array('b', bytes(size))
+        self.bounds = array('B', bytes(size))
+        self.scores = array('d', bytes(8 * size))
+        self.moves = array('b', bytes(size))
+        self.ages = array('B', bytes(size))
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0
+
+    def new_age(self):
+        """
+            Starts a new search, that keeps the entries of the earlier ones.
+        """
+        self.age = (self.age + 1) & 255
+
+    def probe(self, key):
+        """
+            Looks up the position with the hash key.
+            Returns (depth, bound, score, move) or None if the position isn't in the table.
+        """
+        self.probes += 1
+        slot = (key & self.bucket_mask) << 1
+        keys, bounds = self.keys, self.bounds
+        if keys[slot] != key or not bounds[slot]:
+            slot += 1
+            if keys[slot] != key or not bounds[slot]:
+                return None
+        self.hits += 1
+        return self.depths[slot], bounds[slot], self.scores[slot], self.moves[slot]
+
+    def store(self, key, depth, bound, score, move):
+        """
+            Stores the result of a search of the position with the hash key.
+            move: the best move found (square) or -1.
+        """
+        self.stores += 1
+        slot = (key & self.bucket_mask) << 1
+        keys, bounds = self.keys, self.bounds
+        if bounds[slot] and keys[slot] != key and depth < self.depths[slot] and self.ages[slot] == self.age:
+            slot += 1
+        if bounds[slot] and keys[slot] != key:
+            self.collisions += 1
+        keys[slot] = key
+        self.depths[slot] = depth
+        bounds[slot] = bound
+        self.scores[slot] = score
+        self.moves[slot] = move
+        self.ages[slot] = self.age
+
+    def get_hit_rate(self):
+        return self.hits / self.probes if self.probes else 0
+
+    def get_stats(self):
+        """
+            Returns the counters and the share of the slots in use, for sizing the table.
+        """
+        used = self.size - self.bounds.count(0)
+        return {
+            "size": self.size,
+            "used": used / self.size,
+            "probes": self.probes,
+            "hits": self.hits,
+            "hit_rate": self.get_hit_rate(),
+            "stores": self.stores,
+            "collisions": self.collisions,
+            "age": self.age,
+        }
+
+
+# ==============================================================================================
+# ----------------------------------- Multi-ProbCut --------------------------------------------
+# ----------------------------------------------------------------------------------------------
+
+class ProbCut:
+    """
+        The parameters of Multi-ProbCut, a selective search that prunes a position when a shallow
+        search of it makes it very unlikely that the full search would end inside the window.
+        The score of a deep search is modeled as a linear function of the score of a shallow
+        search of the same position: deep = a * shallow + b + error, where the error has the
+        standard deviation sigma. A position is cut when the shallow score is more than threshold
+        standard deviations beyond the bound the model gives for alpha or beta.
+        Every depth that is cut has its own shallow depth and model for every phase of the game
+        (see get_phase), so several cut depths work together (that's the multi in Multi-ProbCut).
+        params: {(phase, depth): (shallow depth, a, b, sigma)}, read from a file written by
+                AI_Players.probcut_fitting. The models only fit the evaluator they were fitted with.
+        threshold: bigger is safer and prunes less.
+    """
+    def __init__(self, params_path=None, threshold=1.5):
+        self.threshold = threshold
+        self.params = {}
+        self.min_depth = 0
+        if params_path:
+            self.load_params(params_path)
+
+    def load_params(self, path):
+        with open(path) as f:
+            pairs = json.load(f)["pairs"]
+        for pair in pairs:
+            if pair["a"] <= 0:
+                raise ValueError(f"{path} has a model with a slope that isn't positive.")
+            key = (pair["phase"], pair["depth"])
+            self.params[key] = (pair["shallow_depth"], pair["a"], pair["b"], pair["sigma"])
+        self.min_depth = min((depth for _, depth in self.params), default=0)
+
+    def get_cut(self, game, depth):
+        """
+            Returns the (shallow depth, a, b, sigma) to test a cut with before searching game to
+            depth, or None if depth isn't cut in game's phase.
+        """
+        if not self.params or depth < self.min_depth:
+            return None
+        return self.params.get((get_phase(64 - game.empty_count), depth))
+
+
 # ==============================================================================================
 # ------------------------------- Monte Carlo Tree Search --------------------------------------
 # ----------------------------------------------------------------------------------------------
 
-class MCTSNode:
+def get_square_prior(square):
     """
-        A node in the MCTS algorithm.
-        Each node represents a state of the game resulted by the move.
-        Each node (except root) has a parent node to help propagate up the tree.
-        Children are nodes added to the tree using the expand method.
-        played is a number representing the number of games simulated on a node or one of its
-        descendants.
-        wins is the number of simulations resulted in wins for the MCTSPlayer played through node
-        or one of its descendants.
+        Returns the part of a move's prior that only depends on its square: higher near the middle
+        of the board, higher for a corner and lower for the squares next to a corner.
+        See MCTSTree.select_child.
     """
-    def __init__(self, state:Game, move=None, parent=None):
-        self.state = state
-        self.move = move
-        self.parent = parent
-        self.children = []
-        self.played = 0
-        self.wins = 0
+    i, j = square_to_move(square)
+    prior = 1 + 1 / math.sqrt((i - 3.5) ** 2 + (j - 3.5) ** 2)
+    if (1 << square) & CORNERS_MASK:
+        prior += 1.5
+    if (1 << square) & bad_moves_mask:
+        prior -= 0.55
+    if (1 << square) & very_bad_moves_mask:
+        prior -= 100
+    return prior
+
+square_priors = [get_square_prior(square) for square in range(64)]
+
+# More than the most moves a position can have, so a tree with this much room can expand any node.
+max_children = 64
 
-    def expand(self):
+
+class MCTSTree:
+    """
+        The tree of the MCTS algorithm, kept in arrays instead of node objects: node k is index k
+        of every array, so a node costs about 50 bytes and nothing for the garbage collector.
+        played: the number of games simulated on a node or one of its descendants.
+        wins: the number of those games won by the player to move in the node's position.
+        parent: the index of the node's parent, -1 for the root (node 0).
+        first_child, child_count: a node's children are next to each other, at indexes
+                                  first_child to first_child + child_count - 1.
+        move: the square of the move that led to the node, -1 for the root.
+        prior: the selection factor of the node's move, see select_child.
+        black, white, player: the node's position as bitboards, and the player to move.
+        The arrays are preallocated and doubled when they're full, up to max_nodes nodes, the
+        node budget. A full tree isn't expanded, and make_room prunes its cold subtrees down to
+        prune_to of the budget (see prune), so the search goes on in bounded memory.
+        Counters: prunes and pruned_nodes, the pruning events and the nodes they dropped.
+    """
+    array_types = {
+        "played": "q", "wins": "q", "parent": "i", "first_child": "i", "child_count": "B",
+        "move": "b", "prior": "d", "black": "Q", "white": "Q", "player": "B",
+    }
+
+    def __init__(self, max_nodes=1_000_000, capacity=1024, prune_to=0.5):
+        if max_nodes * prune_to <= max_children:
+            raise ValueError(f"A tree of {max_nodes} nodes can't be pruned to {prune_to} of them.")
+        self.max_nodes = max_nodes
+        self.prune_to = prune_to
+        self.prunes = 0
+        self.pruned_nodes = 0
+        for name, typecode in self.array_types.items():
+            setattr(self, name, array(typecode))
+        self.size = 0
+        self.reserve(min(capacity, max_nodes))
+
+    def reserve(self, capacity):
         """
-            Adding children for a node in the tree by finding the possible moves of the state's
-            current player and playing each move on the state to create the new states.
+            Grows the arrays to hold capacity nodes.
         """
-        possible_moves = get_possible_moves(self.state.board, self.state.current_player)
+        for name in self.array_types:
+            values = getattr(self, name)
+            if len(values) < capacity:
+                values.frombytes(bytes(values.itemsize * (capacity - len(values))))
 
-        for move, lines in possible_moves.items():
-            child_state = deepcopy(self.state)
-            child_state.play_move(move[0], move[1], lines, self.state.current_player)
-            self.children.append(MCTSNode(child_state, move, parent=self))
-    
-    def back_propagate(self, wins, loss, played):
+    def clear(self):
+        self.size = 0
+
+    def new_root(self, game):
         """
-            This method climbs up the tree and updates all nodes on the way by the relevant values.
+            Empties the tree and makes game its root.
         """
-        player = self.state.current_player
-        self.wins += wins
-        self.played += played
-        parent = self.parent
-        while parent:
-            if parent.state.current_player == player:
-                parent.wins += wins
+        self.size = 1
+        self.set_node(0, -1, -1, 1.0, game.bitboards[1], game.bitboards[2], game.current_player)
+
+    def set_node(self, node, parent, move, prior, black, white, player):
+        self.parent[node] = parent
+        self.first_child[node] = -1
+        self.child_count[node] = 0
+        self.move[node] = move
+        self.prior[node] = prior
+        self.black[node] = black
+        self.white[node] = white
+        self.player[node] = player
+        self.played[node] = 0
+        self.wins[node] = 0
+
+    def get_position(self, node):
+        """
+            Returns the bitboards of the node's position as (own, opp): the player to move's and the
+            opponent's.
+        """
+        if self.player[node] == 1:
+            return self.black[node], self.white[node]
+        return self.white[node], self.black[node]
+
+    def get_game(self, node):
+        return Game.from_bitboards(self.black[node], self.white[node], self.player[node])
+
+    def get_move(self, node):
+        return square_to_move(self.move[node])
+
+    def get_children(self, node):
+        first = self.first_child[node]
+        return range(first, first + self.child_count[node])
+
+    def expand(self, node):
+        """
+            Adds the children of a node, one for every possible move of the player to move.
+            Returns False if no children were added: the player to move has no moves, or the tree
+            has no room for them.
+        """
+        player = self.player[node]
+        own, opp = self.get_position(node)
+        moves = get_moves_mask(own, opp)
+        count = popcount(moves)
+        first = self.size
+        if not count or first + count > self.max_nodes:
+            return False
+        if first + count > len(self.played):
+            self.reserve(min(max(2 * len(self.played), first + count), self.max_nodes))
+        set_node = self.set_node
+        for child, square in enumerate(iter_squares(moves), first):
+            flips = get_flips(own, opp, square)
+            child_own, child_opp = own | flips | (1 << square), opp & ~flips
+            discs = popcount(child_own | child_opp)
+            prior = 1.0 if discs > 50 else square_priors[square] - (popcount(flips) + 1) / discs ** 4
+            if player == 1:
+                set_node(child, node, square, prior, child_own, child_opp, 2)
             else:
-                parent.wins += loss
-            parent.played += played
-            parent = parent.parent
-    
-    def select_child(self, exploration_param, maximize):
+                set_node(child, node, square, prior, child_opp, child_own, 1)
+        self.first_child[node] = first
+        self.child_count[node] = count
+        self.size = first + count
+        return True
+
+    def back_propagate(self, node, wins, loss, played):
+        """
+            Climbs up the tree from node and updates all nodes on the way by the relevant values.
+            wins and loss are for the player to move in node's position.
+        """
+        player = self.player[node]
+        self.wins[node] += wins
+        self.played[node] += played
+        parent = self.parent[node]
+        while parent >= 0:
+            if self.player[parent] == player:
+                self.wins[parent] += wins
+            else:
+                self.wins[parent] += loss
+            self.played[parent] += played
+            parent = self.parent[parent]
+
+    def select_child(self, node, exploration_param, maximize):
         """
             This method handles the selection stage of the MCTS algorithm.
             maximize is a boolean value that's true if the selection is mid algorithm and false for
             final selection. This is to minimize the exploration vs. exploitation relation.
-            Each selection is done by maximizing the Upper Confidence Bound formula on the children of
-            current node, the UCB is refined based on several variables:
-            - inner_score - higher if the node's move is near the middle of the board and gets lower
-                            the farther away from the middle the node's move is.
-            - greed_penalty - this value is higher the more squares are captured by the MCTSPlayer by
-                            the node's move.
-            - move_score - a value representing a great move (corner grab) or a bad/very bad move
-                            (a square near a corner).
-        """
-        index_best_score = 0
-        best_ucb_score = None
-
-        if maximize:
-            best_ucb_score = float("-inf")
-        else:
-            best_ucb_score = float("inf")
+            Each selection is done on the Upper Confidence Bound formula of the children of node,
+            wins / (played + 1) + sqrt(3 * log(exploration_param + 1) / (played + 1)), refined by
+            the child's prior, a factor that's made at expansion:
+            - inner score - higher if the child's move is near the middle of the board and gets
+                            lower the farther away from the middle the move is.
+            - move score - a value representing a great move (corner grab) or a bad/very bad move
+                           (a square near a corner).
+            - greed penalty - higher the more discs the move captures for the player of node.
+            The prior is 1 when the child has more than 50 discs. Mid algorithm the child with the
+            highest ucb * prior is selected, and in the final selection the child with the lowest
+            ucb * (2 - prior) out of the children that were played.
+        """
+        played, wins, priors = self.played, self.wins, self.prior
+        log_games = math.log(exploration_param + 1)
+        c = math.sqrt(3)
+        first = self.first_child[node]
+        best_child = first
+        best_score = float("-inf") if maximize else float("inf")
+        for child in range(first, first + self.child_count[node]):
+            child_played = played[child]
+            ucb_score = wins[child] / (child_played + 1) + c * math.sqrt(log_games / (child_played + 1))
+            if maximize:
+                score = ucb_score * priors[child]
+                if score > best_score:
+                    best_score = score
+                    best_child = child
+            elif child_played > 0:
+                score = ucb_score * (2 - priors[child])
+                if score < best_score:
+                    best_score = score
+                    best_child = child
+        return best_child
 
-        for i, child in enumerate(self.children):
-            ucb_score = child.calculate_ucb(exploration_param, 3)
+    def make_room(self):
+        """
+            Prunes the tree down to prune_to of max_nodes when it might not have room for the
+            children of another node. Returns True if it pruned.
+        """
+        if self.size + max_children <= self.max_nodes:
+            return False
+        self.prune(int(self.max_nodes * self.prune_to))
+        return True
 
-            inner_score = ucb_score / math.sqrt((child.move[0] - 3.5) ** 2 + (child.move[1] - 3.5) ** 2)
-            
-            greed_penalty = ucb_score * (child.state.black_score - self.state.black_score) / (child.state.black_score + child.state.white_score) ** 4
-            if self.state.current_player == 2:
-                greed_penalty = ucb_score * (child.state.white_score - self.state.white_score) / (child.state.black_score + child.state.white_score) ** 4
-
-            move_score = 0.00
-            if child.move in corners:
-                move_score = ucb_score * 1.5
-            if child.move in bad_moves:
-                move_score = ucb_score * (-0.55)
-            if child.move in very_bad_moves:
-                move_score = ucb_score * (-100)
+    def prune(self, target):
+        """
+            Drops the children of the least played nodes until the tree has at most target nodes.
+            Played and wins of a node count all the games of its descendants, so a node whose
+            children are dropped keeps their statistics, and is expanded again if it's selected.
+            A node is played at least as much as its children and comes before them in the arrays,
+            so when the nodes are ranked by (most played, index) every kept node's parent is kept.
+            Returns the number of dropped nodes.
+        """
+        played, child_count = self.played, self.child_count
+        expanded = sorted(
+            (node for node in range(self.size) if child_count[node]),
+            key=lambda node: (-played[node], node),
+        )
+        size = 1
+        kept = set()
+        for node in expanded:
+            if size + child_count[node] > target:
+                break
+            size += child_count[node]
+            kept.add(node)
+        dropped = self.size - size
+        self.compact(0, kept)
+        self.prunes += 1
+        self.pruned_nodes += dropped
+        return dropped
 
-            if maximize:
-                if child.state.black_score + child.state.white_score > 50:
-                    final_ucb_score = ucb_score
-                else:
-                    final_ucb_score = ucb_score + inner_score + move_score - greed_penalty
-                if final_ucb_score > best_ucb_score:
-                    best_ucb_score = final_ucb_score
-                    index_best_score = i
+    def reroot(self, node):
+        """
+            Makes node the root of the tree and drops the rest of the tree.
+        """
+        self.compact(node)
 
+    def compact(self, root, expanded=None):
+        """
+            Keeps the subtree of root, with root as node 0, and drops the rest of the tree. The kept
+            nodes are moved to the start of the arrays (in breadth first order, so children stay
+            next to each other), and the freed room is used by the next nodes.
+            expanded: the nodes whose children are kept, or None to keep the whole subtree.
+        """
+        order = array("i", [root])
+        parents = array("i", [-1])
+        first_children = array("i")
+        child_counts = array("B")
+        k = 0
+        while k < len(order):
+            old = order[k]
+            count = self.child_count[old]
+            if count and (expanded is None or old in expanded):
+                first_children.append(len(order))
+                first = self.first_child[old]
+                order.extend(range(first, first + count))
+                parents.extend([k] * count)
             else:
-                if child.state.black_score + child.state.white_score > 50:
-                    final_ucb_score = ucb_score
-                else:
-                    final_ucb_score = ucb_score - inner_score - move_score + greed_penalty
-                if final_ucb_score < best_ucb_score and child.played > 0:
-                    best_ucb_score = final_ucb_score
-                    index_best_score = i
-
-        return self.children[index_best_score]
-    
-    def calculate_ucb(self, num_games, c_param=3):
-        return (
-            (self.wins / (self.played + 1))
-            + math.sqrt(c_param)
-            * math.sqrt(math.log(num_games + 1) / (self.played + 1))
-        )
-
+                first_children.append(-1)
+                count = 0
+            child_counts.append(count)
+            k += 1
+        capacity = len(self.played)
+        for name, typecode in self.array_types.items():
+            values = getattr(self, name)
+            setattr(self, name, array(typecode, map(values.__getitem__, order)))
+        self.parent = parents
+        self.first_child = first_children
+        self.child_count = child_counts
+        self.size = len(order)
+        self.reserve(capacity)
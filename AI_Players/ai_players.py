@@ -1,9 +1,12 @@
-from copy import deepcopy
 import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from Game.game import *
 from Game.util import *
 import random
 from AI_Players.ai_helper import *
+from AI_Players.endgame import *
+from AI_Players.playouts import *
 
 
 class RandomPlayer(AIPlayer):
@@ -14,10 +17,11 @@ class RandomPlayer(AIPlayer):
         super().__init__(color, name, type)
     
     def find_move(self, game):
-        possible_moves = get_possible_moves(game.board, self.color)
-        moves = list(possible_moves.keys())
+        stats = self.begin_stats(game)
+        moves = game.get_legal_moves(self.color)
+        stats.counters["moves"] = len(moves)
         i, j = moves[random.randrange(0, len(moves))]
-        return i, j
+        return self.end_stats((i, j), "random")
 
 
 class GreedyPlayer(AIPlayer):
@@ -28,19 +32,21 @@ class GreedyPlayer(AIPlayer):
         super().__init__(color, name, type)
 
     def find_move(self, game:Game):
+        stats = self.begin_stats(game)
         best_move = None
         disk_amount = 0
-        possible_moves = get_possible_moves(game.board, self.color)
         cur_discs = game.player_disk_count(self.color)
-        for move, lines in possible_moves.items():
-            amount = cur_discs + sum([len(line) for line in lines])
+        for square in iter_squares(game.get_moves_mask(self.color)):
+            move = square_to_move(square)
+            amount = cur_discs + popcount(game.get_flips(square, self.color))
             # game_copy = copy.deepcopy(game)
             # game_copy.play_move(move[0], move[1], lines, self.color)
             # amount = game_copy.player_disk_count(self.color)
             if amount > disk_amount:
                 best_move = move
                 disk_amount = amount
-        return best_move
+        stats.counters["discs"] = disk_amount
+        return self.end_stats(best_move, "greedy")
 
 
 class MinimaxPlayer(AIPlayer):
@@ -51,67 +57,594 @@ class MinimaxPlayer(AIPlayer):
         A strong move is a corner grab and/or a move that blocks the opponent from placing discs.
         evaluator: is the heuristic the player uses to evaluate a game state.
         depth: defines the max depth of the tree the algorithm explores children nodes.
+        tt_size_mb: the size of the player's transposition table in megabytes, see TranspositionTable.
+        keep_tables: if True, the transposition table, the history scores and the principal variation
+                     are kept from one move to the next (see new_search), so every search starts with
+                     what the searches of the earlier moves found, even when the player changes color
+                     (after Window.replay_game). Otherwise they're cleared for every search.
+        time_limit: a time budget for every move in milliseconds, or None. With a budget the player
+                    searches one ply deeper at a time, until the budget runs out or the end of the game
+                    is reached, and plays the best move of the deepest search it completed. Every search
+                    starts with the best moves of the previous one. Without a budget the player always
+                    searches to depth.
+        move_ordering: if True, the moves of every position are searched in the order of order_moves,
+                       otherwise only the transposition table's best move is moved to the front.
+        endgame_empties: with this many empty squares or less, the player solves the rest of the game
+                         exactly with an EndgameSolver instead of searching.
+        wld_empties: with this many empty squares or less (and more than endgame_empties), the solver
+                     looks for a winning or drawing move. If the game is lost the player searches.
+        workers: the number of processes to search with. With more than 1, the moves at the root are
+                 split between a pool of processes, see search_root_parallel. Call close when the
+                 player isn't needed anymore, to stop the processes.
+        ponder: if True, the player searches the opponent's moves while the opponent thinks, see
+                ponder_on. The next search keeps the tables it filled, even without keep_tables.
+        probcut: a ProbCut with the parameters to prune the search with, or None to search every
+                 move to its full depth. See probcut_test.
+        nodes: the number of positions visited by the last search, to compare the cost of searches.
+        cutoffs: the number of positions of the last search whose moves weren't all searched.
+        principal_variation: the moves the last search expects to be played, as (hash of the position,
+                             square) pairs, starting with the player's move.
     """
-    def __init__(self, color: int, name="MinimaxPlayer", type="AI", evaluator=StaticEvaluator(), depth=6):
-        super().__init__(color, name, type)
+    def __init__(self, color: int, name="MinimaxPlayer", type="AI", evaluator=StaticEvaluator(), depth=6, tt_size_mb=16, time_limit=None, move_ordering=True,
+                 endgame_empties=12, wld_empties=14, workers=1, ponder=False, probcut=None, keep_tables=True):
+        super().__init__(color, name, type, ponder)
         self.evaluator = evaluator
         self.depth = depth
+        self.tt_size_mb = tt_size_mb
+        self.transposition_table = TranspositionTable(tt_size_mb)
+        self.keep_tables = keep_tables
+        self.principal_variation = []
+        self.time_limit = time_limit
+        self.move_ordering = move_ordering
+        self.endgame_solver = EndgameSolver()
+        self.endgame_empties = endgame_empties
+        self.wld_empties = wld_empties
+        self.workers = workers
+        self.probcut = probcut
+        self.executor = None
+        self.search_id = 0
+        self.pondering = False
+        self.pondered = False
+        self.deadline = None
+        self.nodes = 0
+        self.cutoffs = 0
+        self.clear_move_ordering()
+
+    def clear_move_ordering(self):
+        """
+            Resets the killer moves and the history table.
+            killers: the last two moves that caused a cutoff at each ply, indexed by the number of
+                     empty squares (which is the same for all the positions of a ply).
+            history: a score for every [player][square], raised by depth ** 2 on every cutoff the
+                     move causes anywhere in the tree.
+        """
+        self.killers = [[-1, -1] for _ in range(61)]
+        self.history = [None, [0] * 64, [0] * 64]
+
+    def new_search(self):
+        """
+            Prepares the tables for the search of a new position.
+            With keep_tables the transposition table starts a new age, so the entries of earlier moves
+            make room for the new ones, and the history scores are halved, so the new search's cutoffs
+            soon count more. The killer moves are indexed by the number of empty squares, so they're
+            still in the right place for the plies of the new search.
+            The tables are cleared without keep_tables. Their scores are for the player to move (see
+            negamax), so they're kept when the player changes color.
+        """
+        if not self.keep_tables:
+            self.transposition_table.clear()
+            self.clear_move_ordering()
+            self.principal_variation = []
+            return
+        self.transposition_table.new_age()
+        for player in [1, 2]:
+            self.history[player] = [score >> 1 for score in self.history[player]]
+
+    def get_principal_variation(self, game, square):
+        """
+            Returns the moves expected to be played from game, starting with square, as (hash of the
+            position, square) pairs: after square, the best move of every position found in the
+            transposition table. The variation ends at a pass or a position without a best move.
+        """
+        variation = []
+        undos = []
+        while square >= 0 and len(variation) < 60:
+            variation.append((game.get_hash(), square))
+            undos.append(game.make_move(square))
+            moves = game.get_moves_mask(game.current_player)
+            if not moves:
+                break
+            entry = self.transposition_table.probe(game.get_hash())
+            square = entry[3] if entry and entry[3] >= 0 and moves >> entry[3] & 1 else -1
+        for undo in reversed(undos):
+            game.unmake_move(undo)
+        return variation
+
+    def get_principal_variation_move(self, game):
+        """
+            Returns the move the principal variation expects in game, or -1 if game isn't on it.
+        """
+        key = game.get_hash()
+        for variation_key, square in self.principal_variation:
+            if variation_key == key:
+                return square
+        return -1
+
+    def order_root_squares(self, game, squares):
+        """
+            Moves the move of the principal variation, if game is on it, to the front of squares.
+        """
+        square = self.get_principal_variation_move(game)
+        if square in squares:
+            squares.remove(square)
+            squares.insert(0, square)
+        return squares
     
     def find_move(self, game):
+        self.stop_pondering()
+        pondered, self.pondered = self.pondered, False
+        ponder_nodes = self.nodes if pondered else 0
+        stats = self.begin_stats(game)
         move = self.get_opening_move(game)
+        stats.mark("book")
         if move:
-            return move
-        move = self.get_strong_move(game.board, game.current_player)
+            return self.end_stats(move, "book")
+        start = time.perf_counter()
+        self.nodes = 0
+        self.cutoffs = 0
+        stats.counters["ponder_nodes"] = ponder_nodes
+        if game.empty_count <= self.wld_empties:
+            move = self.solve_endgame(game, game.current_player, start)
+            stats.mark("endgame")
+            stats.counters["endgame_nodes"] = self.nodes
+            if move:
+                return self.end_search_stats(move, "endgame")
+        # The trackers the evaluator attaches (see PatternEvaluator.get_indexes) stay on a copy
+        # instead of the caller's game.
+        game = game.copy()
+        move = self.get_strong_move(game, game.current_player)
+        stats.mark("strong_move")
         if move:
-            return move
-        possible_moves = get_possible_moves(game.board, game.current_player)
-        best_move_score = float("-inf")
-        best_move = None
-        for move, lines in possible_moves.items():
-            temp_game = Game(deepcopy(game.board))
-            temp_game.play_move(move[0], move[1], lines, game.current_player)
-            new_board = temp_game.board
-            move_score = self.min_max_alpha_beta(new_board, game.current_player, self.depth, False, float("-inf"), float("inf"))
-            if move_score > best_move_score:
-                best_move_score = move_score
-                best_move = move
-        return best_move
-    
-    def min_max_alpha_beta(self, board, player, depth, max, alpha, beta):
-        game = Game(board)
-        if depth == 0 or game.is_game_over():
-            return self.evaluator.eval(board, player)
+            return self.end_search_stats(move, "strong move")
+        player = game.current_player
+        transposition_table = self.transposition_table
+        if not pondered:
+            self.new_search()
+        probes, hits = transposition_table.probes, transposition_table.hits
+        self.search_id += 1
+        squares = self.order_root_squares(game, self.get_root_squares(game, player))
+        # The searches run on a copy of their own: a search stopped by the time limit leaves the
+        # moves it was in the middle of made on it, and the principal variation is read from game.
+        search_game = game.copy()
+        if self.time_limit is None:
+            self.deadline = None
+            if self.workers > 1 and self.depth >= 4:
+                # A shallow search first, so the moves are split in a good order
+                squares = self.search_root(search_game, self.depth - 2, squares)[0]
+            squares, score = self.search_root(search_game, self.depth, squares)
+            completed_depth = self.depth
+        else:
+            self.deadline = None
+            depth = 0
+            scores = []
+            while True:
+                try:
+                    squares, score = self.search_root_with_aspiration(search_game, depth, squares, scores)
+                except SearchTimeout:
+                    break
+                scores.append(score)
+                completed_depth = depth
+                # The first search is always completed, the budget applies to the deeper ones.
+                self.deadline = start + self.time_limit / 1000
+                if depth >= game.empty_count or abs(score) >= win_score or time.perf_counter() > self.deadline:
+                    break
+                depth += 1
+            self.deadline = None
+        stats.mark("search")
+        probes, hits = transposition_table.probes - probes, transposition_table.hits - hits
+        stats.counters.update({
+            # The moves at the root are a ply of their own
+            "depth": completed_depth + 1,
+            "score": score,
+            "tt_probes": probes,
+            "tt_hits": hits,
+            "tt_hit_rate": hits / probes if probes else 0,
+        })
+        self.principal_variation = self.get_principal_variation(game, squares[0])
+        stats.counters["principal_variation"] = [square for _, square in self.principal_variation]
+        return self.end_search_stats(square_to_move(squares[0]), "search")
+
+    def end_search_stats(self, move, source):
+        """
+            Adds the counters of the move's searches to the stats and finishes them: nodes, cutoffs,
+            nodes per second and, after a search, the effective branching factor (the branching
+            factor of a uniform tree with the same nodes and depth).
+        """
+        stats = self.stats
+        counters = stats.counters
+        elapsed = time.perf_counter() - stats.start
+        counters["nodes"] = self.nodes
+        counters["cutoffs"] = self.cutoffs
+        counters["nps"] = self.nodes / elapsed if elapsed else 0
+        if "depth" in counters:
+            counters["ebf"] = self.nodes ** (1 / counters["depth"])
+        return self.end_stats(move, source)
+
+    def ponder_on(self, game):
+        """
+            Searches the opponent's moves in game one ply deeper at a time, like the search with a time
+            limit does. The positions after the opponent's replies end up in the transposition table,
+            the likely replies searched the deepest, so after the actual reply the search of the
+            player's move starts with them.
+            Runs until the end of the game is reached or ponder_stop is set. Near the end of the game
+            the endgame solver is fast enough on its own, so there's nothing to ponder.
+            nodes and cutoffs count the pondering's positions, the next find_move reports them.
+        """
+        if game.empty_count <= self.wld_empties:
+            return
+        self.nodes = 0
+        self.cutoffs = 0
+        self.new_search()
+        self.pondering = True
+        self.pondered = True
+        # With no deadline to pass, only ponder_stop stops the search
+        self.deadline = float("inf")
+        squares = self.order_root_squares(game, list(iter_squares(game.get_moves_mask(game.current_player))))
+        try:
+            for depth in range(game.empty_count + 1):
+                squares, score = self.search_root(game, depth, squares)
+                if abs(score) >= win_score:
+                    break
+        except SearchTimeout:
+            pass
+        finally:
+            self.deadline = None
+            self.pondering = False
+
+    def solve_endgame(self, game, player, start):
+        """
+            Solves the end of the game with the endgame solver, exactly or for a win, loss or draw
+            only (see endgame_empties and wld_empties).
+            With a time limit the solver gets half of the budget, and the search gets the rest if
+            the solver runs out of time.
+            Returns the move to play, or None if the solver ran out of time or only found out the
+            game is lost.
+        """
+        solver = self.endgame_solver
+        solver.nodes = 0
+        if self.time_limit is not None:
+            solver.deadline = start + self.time_limit / 2000
+        own, opp = game.bitboards[player], game.bitboards[3 - player]
+        wld = game.empty_count > self.endgame_empties
+        try:
+            square, score = solver.solve_move(own, opp, wld)
+        except SearchTimeout:
+            square, score = -1, None
+        finally:
+            solver.deadline = None
+            self.nodes += solver.nodes
+        if square < 0 or (wld and score < 0):
+            return None
+        return square_to_move(square)
+
+    def get_root_squares(self, game, player):
+        """
+            Returns the squares of the moves to search.
+            In a symmetric position (mostly in the opening) some moves lead to mirror images of each
+            other, which have the same score, so only one of them is kept.
+        """
+        squares = list(iter_squares(game.get_moves_mask(player)))
+        black, white = game.bitboards[1], game.bitboards[2]
+        if (black, white) not in get_symmetries(black, white)[1:]:
+            return squares
+        searched = set()
+        unique_squares = []
+        for square in squares:
+            undo = game.make_move(square)
+            key, _ = game.get_canonical_key()
+            game.unmake_move(undo)
+            if key not in searched:
+                searched.add(key)
+                unique_squares.append(square)
+        return unique_squares
+
+    def search_root_with_aspiration(self, game, depth, squares, scores):
+        """
+            Searches the root to depth with an aspiration window: a window around the score of the
+            previous depth, as wide as the last change of the score between depths. When the score
+            falls outside of the window the search is repeated with a window 4 times wider on that
+            side, starting with the moves that did best.
+            scores: the scores of the previous depths.
+            Returns the same as search_root.
+        """
+        if len(scores) < 2:
+            return self.search_root(game, depth, squares)
+        delta = max(abs(scores[-1] - scores[-2]), 1)
+        alpha, beta = scores[-1] - delta, scores[-1] + delta
+        while True:
+            squares, score = self.search_root(game, depth, squares, alpha, beta)
+            if score <= alpha:
+                alpha = score - delta
+            elif score >= beta:
+                beta = score + delta
+            else:
+                return squares, score
+            delta *= 4
+
+    def search_root(self, game, depth, squares, alpha=float("-inf"), beta=float("inf")):
+        """
+            Searches the moves on squares, in their order, to depth with principal variation search
+            (see negamax).
+            Returns (squares, score): the squares sorted from the best move to the worst, and the
+            score of the best move. Moves with the same score keep their order, and after the best
+            move the scores are only bounds, since the rest of the moves are only searched to show
+            they aren't better. If a move scores beta or more, the moves after it aren't searched,
+            they're left at the end.
+        """
+        # Below depth 3 the searches are too short to pay for sending them to other processes.
+        # Pondering stays in this process, the searches of the processes don't fill this table.
+        if self.workers > 1 and depth >= 3 and len(squares) > 1 and not self.pondering:
+            return self.search_root_parallel(game, depth, squares, alpha, beta)
+        scores = {}
+        best_score = float("-inf")
+        for square in squares:
+            undo = game.make_move(square)
+            if best_score == float("-inf"):
+                score = -self.negamax(game, depth, -beta, -alpha)
+            else:
+                lower = best_score if best_score > alpha else alpha
+                score = -self.negamax(game, depth, -lower - 1, -lower)
+                if lower < score < beta:
+                    score = -self.negamax(game, depth, -beta, -lower)
+            game.unmake_move(undo)
+            scores[square] = score
+            if score > best_score:
+                best_score = score
+            if best_score >= beta:
+                break
+        squares = sorted(squares, key=lambda square: -scores.get(square, float("-inf")))
+        return squares, best_score
+
+    def search_root_parallel(self, game, depth, squares, alpha=float("-inf"), beta=float("inf")):
+        """
+            Same as search_root, with the moves split between the player's processes (Young Brothers
+            Wait): the first move is searched here first, to get a bound for the rest. Then the rest
+            of the moves are searched at the same time, each in a process, with a zero window at the
+            bound. Moves that beat the bound are searched again with the full window, one at a time
+            and in their order, like search_root does, so the result is the same as search_root's.
+        """
+        scores = {}
+        first = squares[0]
+        undo = game.make_move(first)
+        best_score = -self.negamax(game, depth, -beta, -alpha)
+        game.unmake_move(undo)
+        scores[first] = best_score
+        if best_score < beta:
+            window = best_score if best_score > alpha else alpha
+            time_left = self.deadline - time.perf_counter() if self.deadline else None
+            executor = self.get_executor()
+            futures = {}
+            for square in squares[1:]:
+                undo = game.make_move(square)
+                futures[square] = executor.submit(
+                    _search_in_worker, self.search_id, game.bitboards[1], game.bitboards[2], game.current_player,
+                    depth, -window - 1, -window, time_left
+                )
+                game.unmake_move(undo)
+            try:
+                for square, future in futures.items():
+                    score, nodes = future.result()
+                    scores[square] = -score
+                    self.nodes += nodes
+            finally:
+                for future in futures.values():
+                    future.cancel()
+            # A move that beat the zero window is at least as good as its score, so it's searched
+            # again even if its score is under the best score by now.
+            for square in squares[1:]:
+                lower = best_score if best_score > alpha else alpha
+                if window < scores[square] < beta:
+                    undo = game.make_move(square)
+                    scores[square] = -self.negamax(game, depth, -beta, -lower)
+                    game.unmake_move(undo)
+                if scores[square] > best_score:
+                    best_score = scores[square]
+                if best_score >= beta:
+                    break
+        squares = sorted(squares, key=lambda square: -scores.get(square, float("-inf")))
+        return squares, best_score
+
+    def get_executor(self):
+        """
+            Returns the player's pool of processes, starting it on the first call. Every process has
+            its own MinimaxPlayer with the same settings, see _init_worker.
+            The processes aren't forked from this one, which may be running other threads (the
+            opponent's pondering, the GUI) that a fork could catch holding a lock.
+        """
+        if self.executor is None:
+            settings = {
+                "color": self.color,
+                "evaluator": self.evaluator,
+                "tt_size_mb": self.tt_size_mb,
+                "move_ordering": self.move_ordering,
+                "probcut": self.probcut,
+            }
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self.executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context(start_method),
+                initializer=_init_worker, initargs=(settings,)
+            )
+        return self.executor
+
+    def __getstate__(self):
+        # A copy of the player starts its own pool of processes when it needs one
+        state = super().__getstate__()
+        state["executor"] = None
+        return state
+
+    def close(self):
+        """
+            Stops the player's processes, if it started any.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+
+    def negamax(self, game, depth, alpha, beta):
+        """
+            Principal variation search in negamax form. Returns the score of the game for the player to
+            move, so the score of a move is minus the score of the game after it. The leaves are scored
+            for the player to move too (see Evaluator.eval_to_move), so no score depends on which
+            player searches, and the tables stay right when the player changes color.
+            The first move is searched with the (alpha, beta) window, and every other move with a zero
+            window just above alpha, to show it isn't better. Only a move that turns out better is
+            searched again with the full window.
+            A player without moves passes, which doesn't count as a ply.
+            The game is searched in place with make_move/unmake_move, so game is left exactly as it
+            was given when the method returns.
+            Finished games, and games already decided by stable discs, get a score beyond the
+            evaluator's range instead of a heuristic one, so their subtrees aren't searched.
+            Searched positions are stored in the transposition table with the type of bound their
+            score is, and a stored search at least as deep narrows the window or gives the score.
+            The moves are searched in the order of order_moves.
+            With probcut, positions that a shallow search shows to be outside of the window are
+            cut before their moves are searched.
+            Raises SearchTimeout when the player's deadline passes, or when pondering is stopped.
+        """
+        self.nodes += 1
+        if self.deadline and not self.nodes & 255 and (time.perf_counter() > self.deadline or self.ponder_stop.is_set()):
+            raise SearchTimeout()
+        current_player = game.current_player
+        if game.is_game_over():
+            return get_game_over_score(game, current_player)
+        decided_score = get_stability_score(game, current_player)
+        if decided_score is not None:
+            return decided_score
+        if depth == 0:
+            return self.evaluator.eval_to_move(game)
         
-        possible_moves = {}
-        other_player = 1 if player == 2 else 2
-        if max:
-            possible_moves = get_possible_moves(board, player)
+        moves = game.get_moves_mask(current_player)
+        if not moves:
+            game.switch_player()
+            score = -self.negamax(game, depth, -beta, -alpha)
+            game.switch_player()
+            return score
+
+        transposition_table = self.transposition_table
+        key = game.get_hash()
+        entry = transposition_table.probe(key)
+        entry_move = -1
+        if entry:
+            entry_depth, bound, entry_score, entry_move = entry
+            if entry_depth >= depth:
+                if bound == exact_bound:
+                    return entry_score
+                if bound == lower_bound and entry_score > alpha:
+                    alpha = entry_score
+                elif bound == upper_bound and entry_score < beta:
+                    beta = entry_score
+                if alpha >= beta:
+                    return entry_score
+        if self.probcut:
+            cut = self.probcut.get_cut(game, depth)
+            if cut:
+                score = self.probcut_test(game, alpha, beta, cut)
+                if score is not None:
+                    return score
+        if self.move_ordering:
+            squares = self.order_moves(game, moves, depth, entry_move)
+        elif entry_move >= 0:
+            squares = [entry_move] + [square for square in iter_squares(moves) if square != entry_move]
         else:
-            possible_moves = get_possible_moves(board, other_player)
-        if not possible_moves:
-            return self.min_max_alpha_beta(board, player, depth - 1, not max, alpha, beta)
-        score = float("-inf") if max else float("inf")
+            squares = iter_squares(moves)
+        window_alpha, window_beta = alpha, beta
+        best_score = float("-inf")
+        best_square = -1
         
-        for move, lines in possible_moves.items():
-            temp_game = Game(deepcopy(game.board))
-            temp_game.play_move(move[0], move[1], lines, player if max else other_player)
-            new_board = temp_game.board
-            move_score = self.min_max_alpha_beta(new_board, player, depth - 1, not max, alpha, beta)
-            if max:
-                if move_score > score:
-                    score = move_score
+        for square in squares:
+            undo = game.make_move(square)
+            if best_square < 0:
+                score = -self.negamax(game, depth - 1, -beta, -alpha)
+            else:
+                score = -self.negamax(game, depth - 1, -alpha - 1, -alpha)
+                if alpha < score < beta:
+                    score = -self.negamax(game, depth - 1, -beta, -alpha)
+            game.unmake_move(undo)
+            if score > best_score:
+                best_score = score
+                best_square = square
                 if score > alpha:
                     alpha = score
-            else:
-                if move_score < score:
-                    score = move_score
-                if score < beta:
-                    beta = score
-            if beta <= alpha:
+            if alpha >= beta:
+                self.cutoffs += 1
+                killers = self.killers[game.empty_count]
+                if square != killers[0]:
+                    killers[1] = killers[0]
+                    killers[0] = square
+                self.history[current_player][square] += depth * depth
                 break
-        return score
+
+        if best_score <= window_alpha:
+            bound = upper_bound
+        elif best_score >= window_beta:
+            bound = lower_bound
+        else:
+            bound = exact_bound
+        transposition_table.store(key, depth, bound, best_score, best_square)
+        return best_score
     
-    def get_strong_move(self, board, player):
+    def probcut_test(self, game, alpha, beta, cut):
+        """
+            Tests if a search of game is very likely to fail high or low, with a zero window search
+            to the shallow depth of cut (see ProbCut) at the shallow score that the model maps to
+            beta plus the margin (or alpha minus it).
+            Returns beta or alpha if the search is cut, otherwise None.
+            Windows with a decisive bound aren't tested, the model only fits heuristic scores.
+        """
+        shallow_depth, a, b, sigma = cut
+        margin = self.probcut.threshold * sigma
+        if beta < win_score:
+            bound = math.ceil((beta + margin - b) / a)
+            if self.negamax(game, shallow_depth, bound - 1, bound) >= bound:
+                return beta
+        if alpha > -win_score:
+            bound = math.floor((alpha - margin - b) / a)
+            if self.negamax(game, shallow_depth, bound, bound + 1) <= bound:
+                return alpha
+        return None
+
+    def order_moves(self, game, moves, depth, tt_move):
+        """
+            Returns the squares of moves in the order to search them:
+            1. tt_move, the best move the transposition table has for the position (or -1).
+            2. The killer moves of the ply.
+            3. The rest of the moves by their history score, then by square_static_weights, then by
+               the number of moves the opponent has after the move, fewest first. The opponent's
+               moves are only counted when depth is more than 1, where the subtrees are big enough
+               to pay for it.
+        """
+        player = game.current_player
+        first = []
+        if tt_move >= 0 and moves >> tt_move & 1:
+            first.append(tt_move)
+        for killer in self.killers[game.empty_count]:
+            if killer >= 0 and killer != tt_move and moves >> killer & 1:
+                first.append(killer)
+        history = self.history[player]
+        rest = [square for square in iter_squares(moves) if square not in first]
+        if depth > 1:
+            own, opp = game.bitboards[player], game.bitboards[3 - player]
+            keys = {}
+            for square in rest:
+                flips = get_flips(own, opp, square)
+                opponent_moves = get_moves_mask(opp & ~flips, own | flips | (1 << square))
+                keys[square] = (history[square], square_weights[square], -popcount(opponent_moves))
+        else:
+            keys = {square: (history[square], square_weights[square]) for square in rest}
+        rest.sort(key=keys.__getitem__, reverse=True)
+        return first + rest
+
+    def get_strong_move(self, game, player):
         """
             This method iterates over the possible moves to check if a strong move is available.
             If such a move is possible, the moves value is calculated and the move with the max value
@@ -122,26 +655,26 @@ class MinimaxPlayer(AIPlayer):
             3. A blocking move.
             If none of them is possible, it will find a move using the Min-Max algorithm.
         """
-        possible_moves = get_possible_moves(board, player)
         corner_move, blocker_move = None, None
         best_corner, best_blocker = float("-inf"), float("-inf")
-        for move, lines in possible_moves.items():
-            temp_board = deepcopy(board)
-            temp_game = Game(temp_board)
-            temp_game.play_move(move[0], move[1], lines, player)
+        other_player = 1 if player == 2 else 2
+        for square in iter_squares(game.get_moves_mask(player)):
+            move = square_to_move(square)
+            undo = game.make_move(square)
             if move in corners:
-                move_value = self.evaluator.eval(temp_game.board, player)
+                move_value = self.evaluator.eval(game, player)
                 if move_value > best_corner:
                     best_corner = move_value
                     corner_move = move
-            other_player = 1 if player == 2 else 2
-            if len(get_possible_moves(temp_game.board, other_player)) == 0:
-                move_value = self.evaluator.eval(temp_game.board, player)
+            if not game.get_moves_mask(other_player):
+                move_value = self.evaluator.eval(game, player)
                 if move_value > best_blocker:
                     best_blocker = move_value
                     blocker_move = move
                     if blocker_move == corner_move:
+                        game.unmake_move(undo)
                         return blocker_move
+            game.unmake_move(undo)
         if corner_move:
             return corner_move
         if blocker_move:
@@ -149,43 +682,182 @@ class MinimaxPlayer(AIPlayer):
         return None
 
 
+# The MinimaxPlayer of a process in a MinimaxPlayer's pool, and the search its tables belong to.
+_worker_player = None
+_worker_search_id = None
+
+def _init_worker(settings):
+    global _worker_player
+    _worker_player = MinimaxPlayer(**settings)
+
+def _search_in_worker(search_id, black, white, current_player, depth, alpha, beta, time_left):
+    """
+        Searches a position for the MinimaxPlayer in a process of its pool, see search_root_parallel.
+        The tables of the process's player are kept for all the searches of one move.
+        Returns (score, nodes).
+    """
+    global _worker_search_id
+    worker = _worker_player
+    if search_id != _worker_search_id:
+        _worker_search_id = search_id
+        worker.transposition_table.clear()
+        worker.clear_move_ordering()
+    worker.deadline = time.perf_counter() + time_left if time_left is not None else None
+    worker.nodes = 0
+    game = Game.from_bitboards(black, white, current_player)
+    score = worker.negamax(game, depth, alpha, beta)
+    return score, worker.nodes
+
+
 class MCTSPlayer(AIPlayer):
     """
         An AI player for the Reversi game that finds a move using the Monte Carlo Tree Search algorithm.
+        ponder: if True, the player grows its tree from the opponent's position while the opponent
+                thinks, see ponder_on.
+        seed: the seed of the player's random generator, which picks the moves of the playouts, see
+              PlayoutEngine. None seeds it from the system.
+        playouts: "python" to play the num_sims playouts of a rollout one at a time (PlayoutEngine),
+                  or "numpy" to play them all at the same time (NumpyPlayoutEngine), which is only
+                  faster with a num_sims in the hundreds or more.
+        reuse_tree: if True, the player keeps the subtree of the move it played in tree, and the next
+                    find_move continues from the subtree of the opponent's reply, see get_reused_root.
+        max_nodes: the node budget of the tree (an MCTSTree). The least played subtrees are pruned
+                   when the tree reaches it, see MCTSTree.prune.
     """
-    def __init__(self, color: int, name="MCTSPlayer", type="AI", num_sims=20, max_iter=300):
-        super().__init__(color, name, type)
+    def __init__(self, color: int, name="MCTSPlayer", type="AI", num_sims=20, max_iter=300, ponder=False, seed=None,
+                 playouts="python", reuse_tree=True, max_nodes=1_000_000):
+        super().__init__(color, name, type, ponder)
         self.num_sims = num_sims
         self.max_iter = max_iter
+        if playouts == "python":
+            self.playout_engine = PlayoutEngine(seed)
+        elif playouts == "numpy":
+            self.playout_engine = NumpyPlayoutEngine(seed)
+        else:
+            raise ValueError(f"Unknown playouts: {playouts}.")
+        self.reuse_tree = reuse_tree
+        # Node 0 is the position after the player's last move when the tree is kept, otherwise the
+        # tree is empty.
+        self.tree = MCTSTree(max_nodes)
     
     def find_move(self, game:Game):
+        self.stop_pondering()
+        stats = self.begin_stats(game)
         move = self.get_opening_move(game)
+        stats.mark("book")
+        tree = self.tree
         if move:
-            return move
-        root = MCTSNode(game)
-        root.expand()
-        random.seed(time.time())
-        current_node = root.children[random.randrange(0, len(root.children))]
-        wins, loss, _, total_elapsed = rollout(current_node.state, self.num_sims)
-        current_node.back_propagate(wins, loss, self.num_sims)
-        exploration_param = self.num_sims
-
-        for i in range(self.max_iter):
-            current_node = root.select_child(exploration_param, maximize=True)
-            while current_node.children:
-                current_node = current_node.select_child(exploration_param, maximize=True)
-            if current_node.played != 0:
-                current_node.expand()
-                if current_node.children:
-                    current_node = current_node.select_child(exploration_param, maximize=True)
-            wins, loss, _, elapsed = rollout(current_node.state, self.num_sims)
-            total_elapsed += elapsed
-            exploration_param += self.num_sims
-            current_node.back_propagate(wins, loss, self.num_sims)
-            exploration_param += self.num_sims
-            if total_elapsed > 1.0:
+            tree.clear()
+            return self.end_stats(move, "book")
+        prunes, pruned_nodes = tree.prunes, tree.pruned_nodes
+        root = self.get_reused_root(game)
+        stats.counters["reused"] = root is not None
+        stats.counters["reused_played"] = tree.played[root] if root is not None else 0
+        elapsed = 0
+        iterations = 0
+        if root is None:
+            root = 0
+            tree.new_root(game)
+            tree.expand(root)
+            current_node = tree.first_child[root] + self.playout_engine.rng.randrange(0, tree.child_count[root])
+            elapsed = self.rollout(current_node)
+            iterations = 1
+        more_iterations, search_elapsed = self.search(root, self.max_iter, time_limit=1.0 - elapsed)
+        iterations += more_iterations
+        elapsed += search_elapsed
+        child = tree.select_child(root, 0, maximize=False)
+        move = tree.get_move(child)
+        stats.mark("search")
+        rollouts = iterations * self.num_sims
+        stats.counters.update({
+            "iterations": iterations,
+            "rollouts": rollouts,
+            "rollouts_per_second": rollouts / elapsed if elapsed else 0,
+            "rollout_time": elapsed,
+            "tree_size": tree.size,
+            "root_played": tree.played[root],
+            "prunes": tree.prunes - prunes,
+            "pruned_nodes": tree.pruned_nodes - pruned_nodes,
+        })
+        if self.reuse_tree:
+            # Only the subtree of the move is kept
+            tree.reroot(child)
+        else:
+            tree.clear()
+        return self.end_stats(move, "search")
+
+    def rollout(self, node):
+        """
+            Plays num_sims playouts from the node's position and back propagates their results.
+            Returns the seconds the playouts took.
+        """
+        own, opp = self.tree.get_position(node)
+        wins, loss, _, elapsed = self.playout_engine.rollout_position(own, opp, self.num_sims)
+        self.tree.back_propagate(node, wins, loss, self.num_sims)
+        return elapsed
+
+    def search(self, root, max_iter, time_limit=None):
+        """
+            Runs up to max_iter iterations of the algorithm on the tree of root: selection, expansion,
+            simulation and back propagation. Stops early when the simulations took time_limit seconds,
+            or when pondering is stopped. The tree is pruned when it's full (see MCTSTree.make_room),
+            so root has to be the root of the tree, node 0.
+            Returns (iterations, seconds the simulations took).
+        """
+        tree = self.tree
+        # Grows by 2 * num_sims on every iteration, as the root's played grows by num_sims
+        exploration_param = 2 * tree.played[root] - self.num_sims
+        total_elapsed = 0
+        iterations = 0
+        while iterations < max_iter:
+            iterations += 1
+            tree.make_room()
+            current_node = tree.select_child(root, exploration_param, maximize=True)
+            while tree.child_count[current_node]:
+                current_node = tree.select_child(current_node, exploration_param, maximize=True)
+            if tree.played[current_node] != 0 and tree.expand(current_node):
+                current_node = tree.select_child(current_node, exploration_param, maximize=True)
+            total_elapsed += self.rollout(current_node)
+            exploration_param += 2 * self.num_sims
+            if time_limit is not None and total_elapsed > time_limit:
+                break
+            if self.ponder_stop.is_set():
                 break
-        child = root.select_child(0, maximize=False)
-        move = child.move
-        return move
+        return iterations, total_elapsed
 
+    def ponder_on(self, game):
+        """
+            Grows the tree of game, the opponent's position, so every likely reply of the opponent
+            gets a subtree. The tree kept from the player's last move is grown when it's game's tree,
+            otherwise a new one is started. Stops after 10 times the iterations of a move, so the
+            tree doesn't grow without a bound while the opponent thinks.
+        """
+        tree = self.tree
+        if not tree.size or (tree.black[0], tree.white[0], tree.player[0]) != (*game.bitboards[1:], game.current_player):
+            tree.new_root(game)
+        if not tree.child_count[0]:
+            if not tree.expand(0):
+                return
+            for child in tree.get_children(0):
+                self.rollout(child)
+                if self.ponder_stop.is_set():
+                    break
+        self.search(0, 10 * self.max_iter)
+
+    def get_reused_root(self, game):
+        """
+            Makes the subtree of the tree (the position after the player's last move) that starts at
+            game, after the opponent's reply, the tree, and returns its root (0).
+            Returns None, and empties the tree, if there's no tree to reuse, game isn't in it (after
+            a load, or when the opponent passed) or its subtree is still empty.
+        """
+        tree = self.tree
+        if tree.size:
+            for child in tree.get_children(0):
+                if (tree.black[child], tree.white[child], tree.player[child]) == (*game.bitboards[1:], game.current_player):
+                    if tree.child_count[child]:
+                        tree.reroot(child)
+                        return 0
+                    break
+        tree.clear()
+        return None
@@ -0,0 +1,204 @@
+from Game.util import *
+from Game.game import *
+from AI_Players.ai_helper import *
+
+
+# ==============================================================================================
+# ---------------------------------- Endgame solver --------------------------------------------
+# ----------------------------------------------------------------------------------------------
+
+# Masks of the four 4x4 quadrants of the board. Near the end of the game the empty squares are
+# split into small regions, and the player who plays last in a region usually gains there, so
+# moves in regions with an odd number of empty squares are tried first (parity ordering).
+quadrant_masks = [
+    0x000000000F0F0F0F, 0x00000000F0F0F0F0,
+    0x0F0F0F0F00000000, 0xF0F0F0F000000000,
+]
+
+# The quadrant mask of every square.
+square_quadrants = [next(mask for mask in quadrant_masks if mask >> square & 1) for square in range(64)]
+
+
+class EndgameSolver:
+    """
+        Searches the game to the end, to find the exact final disc difference (the player to move's
+        discs - the opponent's discs, the same as get_game_over_score uses).
+        The search works on bitboards (own: the player to move, opp: the opponent) instead of a
+        Game, so it doesn't pay for anything it doesn't need.
+        Moves are ordered fastest-first (fewest opponent moves after the move) while there are at
+        least fastest_first_empties empty squares, and by parity after that. The last 4 empty
+        squares are searched without generating moves, by trying the empty squares themselves.
+        Positions with at least stability_empties empty squares are cut off when the stable discs
+        (see get_final_score_bounds) already put the result outside of the window.
+        Positions with at least table_empties empty squares are kept in table, a dict of
+        {(own, opp): (lower bound, upper bound, best move)}, so transpositions are searched once.
+        The table is emptied by every solve_move.
+        nodes: the number of positions visited since the counter was last reset.
+        deadline: a time.perf_counter() time to raise SearchTimeout at, or None.
+    """
+    def __init__(self, fastest_first_empties=6, stability_empties=8, table_empties=5):
+        self.fastest_first_empties = fastest_first_empties
+        self.stability_empties = stability_empties
+        self.table_empties = table_empties
+        self.table = {}
+        self.nodes = 0
+        self.deadline = None
+
+    def solve_move(self, own, opp, wld=False):
+        """
+            Finds own's best move.
+            Returns (square, score), where score is the exact final disc difference after the
+            move, or (-1, None) if own has no moves.
+            wld: only find out if the game is won, lost or drawn. The score is then only right
+                 in its sign, and the square is a winning move if there is one.
+        """
+        alpha, beta = (-1, 1) if wld else (-64, 64)
+        empty = ~(own | opp) & FULL_MASK
+        self.table = {}
+        best_square, best_score = -1, None
+        for square in self.order_moves(own, opp, get_moves_mask(own, opp), empty):
+            flips = get_flips(own, opp, square)
+            score = -self.solve(opp & ~flips, own | flips | (1 << square), -beta, -alpha)
+            if best_score is None or score > best_score:
+                best_square, best_score = square, score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return best_square, best_score
+
+    def solve(self, own, opp, alpha=-64, beta=64):
+        """
+            Returns own's final disc difference if it's inside of the (alpha, beta) window,
+            otherwise a bound on the side of the window it's on (fail-soft alpha-beta).
+            Raises SearchTimeout when the deadline passes.
+        """
+        self.nodes += 1
+        if self.deadline and not self.nodes & 1023 and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        empty = ~(own | opp) & FULL_MASK
+        empty_count = popcount(empty)
+        if empty_count <= 4:
+            return self.solve_last_squares(own, opp, alpha, beta, self.order_by_parity(empty), False)
+        moves = get_moves_mask(own, opp)
+        if not moves:
+            if not get_moves_mask(opp, own):
+                return popcount(own) - popcount(opp)
+            return -self.solve(opp, own, -beta, -alpha)
+        if empty_count >= self.table_empties:
+            key = (own, opp)
+            entry = self.table.get(key)
+            if entry:
+                lower, upper, best_square = entry
+                if lower >= beta:
+                    return lower
+                if upper <= alpha:
+                    return upper
+                if lower > alpha:
+                    alpha = lower
+                if upper < beta:
+                    beta = upper
+        else:
+            entry = None
+        if empty_count >= self.stability_empties:
+            lower, upper = get_final_score_bounds(own, opp)
+            if lower >= beta:
+                return lower
+            if upper <= alpha:
+                return upper
+        window_alpha, window_beta = alpha, beta
+        squares = self.order_moves(own, opp, moves, empty)
+        if entry and entry[2] in squares:
+            squares.remove(entry[2])
+            squares.insert(0, entry[2])
+        best_score, best_square = -65, -1
+        for square in squares:
+            flips = get_flips(own, opp, square)
+            score = -self.solve(opp & ~flips, own | flips | (1 << square), -beta, -alpha)
+            if score > best_score:
+                best_score, best_square = score, square
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if empty_count >= self.table_empties:
+            lower, upper = (entry[0], entry[1]) if entry else (-64, 64)
+            if best_score <= window_alpha:
+                upper = min(upper, best_score)
+            elif best_score >= window_beta:
+                lower = max(lower, best_score)
+            else:
+                lower = upper = best_score
+            self.table[key] = (lower, upper, best_square)
+        return best_score
+
+    def solve_last_squares(self, own, opp, alpha, beta, squares, passed):
+        """
+            Same as solve, for positions with 4 empty squares or less, given as a list in the
+            order to try them. Moves are found by trying to capture from every empty square.
+            passed: True if the opponent couldn't move before this position.
+        """
+        self.nodes += 1
+        if len(squares) == 1:
+            return self.solve_last_square(own, opp, squares[0])
+        best_score = -65
+        for k, square in enumerate(squares):
+            flips = get_flips(own, opp, square)
+            if not flips:
+                continue
+            rest = squares[:k] + squares[k + 1:]
+            score = -self.solve_last_squares(opp & ~flips, own | flips | (1 << square), -beta, -alpha, rest, False)
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        if best_score == -65:
+            if passed:
+                return popcount(own) - popcount(opp)
+            return -self.solve_last_squares(opp, own, -beta, -alpha, squares, True)
+        return best_score
+
+    def solve_last_square(self, own, opp, square):
+        """
+            Returns own's final disc difference with one empty square left.
+            Whoever can capture from the square plays it, own first.
+        """
+        disc_difference = popcount(own) - popcount(opp)
+        flips = get_flips(own, opp, square)
+        if flips:
+            return disc_difference + 2 * popcount(flips) + 1
+        flips = get_flips(opp, own, square)
+        if flips:
+            return disc_difference - 2 * popcount(flips) - 1
+        return disc_difference
+
+    def order_moves(self, own, opp, moves, empty):
+        """
+            Returns the squares of moves in the order to search them: fastest-first with parity to
+            break ties while there are enough empty squares to pay for it, otherwise by parity.
+        """
+        if popcount(empty) < self.fastest_first_empties:
+            return self.order_by_parity(moves, empty)
+        keys = {}
+        for square in iter_squares(moves):
+            flips = get_flips(own, opp, square)
+            opponent_moves = get_moves_mask(opp & ~flips, own | flips | (1 << square))
+            keys[square] = 2 * popcount(opponent_moves) + (1 - popcount(empty & square_quadrants[square]) % 2)
+        return sorted(keys, key=keys.__getitem__)
+
+    def order_by_parity(self, squares, empty=None):
+        """
+            Returns the squares in the mask squares, the ones in quadrants with an odd number of
+            empty squares first.
+        """
+        if empty is None:
+            empty = squares
+        odd, even = [], []
+        for square in iter_squares(squares):
+            if popcount(empty & square_quadrants[square]) % 2:
+                odd.append(square)
+            else:
+                even.append(square)
+        return odd + even
@@ -0,0 +1,176 @@
+from array import array
+from Game.util import *
+from Game.game import *
+
+
+# ==============================================================================================
+# ------------------------- Patterns of the pattern evaluator ----------------------------------
+# ----------------------------------------------------------------------------------------------
+# A pattern is a list of squares. The discs on the squares of a pattern are read as a number
+# in base 3 (0 empty, 1 black, 2 white, the first square is the lowest digit), and that number
+# is the pattern's index into its table of weights.
+# Every pattern is given in one orientation and used in all the orientations the 8 board
+# symmetries give it. All the orientations of a pattern share one table.
+
+patterns = {
+    # The edge and the two X-squares next to its corners
+    "edge_x": [(0, j) for j in range(8)] + [(1, 1), (1, 6)],
+    "corner_2x5": [(i, j) for i in range(2) for j in range(5)],
+    "corner_3x3": [(i, j) for i in range(3) for j in range(3)],
+    "diagonal_8": [(k, k) for k in range(8)],
+    "diagonal_7": [(k, k + 1) for k in range(7)],
+    "diagonal_6": [(k, k + 2) for k in range(6)],
+    "diagonal_5": [(k, k + 3) for k in range(5)],
+    "diagonal_4": [(k, k + 4) for k in range(4)],
+    "row_2": [(1, j) for j in range(8)],
+    "row_3": [(2, j) for j in range(8)],
+    "row_4": [(3, j) for j in range(8)],
+}
+
+pattern_names = list(patterns)
+
+# The number of phases the weights are split into. The phase of a position is set by the
+# number of discs on the board, see get_phase.
+phase_count = 6
+
+
+def get_phase(disc_count):
+    return min((disc_count - 4) // 10, phase_count - 1)
+
+
+def get_pattern_instances():
+    """
+        Returns a list of (pattern name, squares) with every orientation of every pattern.
+        Orientations that cover the same squares as an earlier one are left out.
+    """
+    instances = []
+    for name, squares in patterns.items():
+        seen = set()
+        for transform in range(8):
+            transformed = [transform_square(move_to_square(i, j), transform) for i, j in squares]
+            if frozenset(transformed) not in seen:
+                seen.add(frozenset(transformed))
+                instances.append((name, transformed))
+    return instances
+
+
+pattern_instances = get_pattern_instances()
+
+# The index of the table of each instance in pattern_names.
+instance_patterns = [pattern_names.index(name) for name, _ in pattern_instances]
+
+# (instance, 3 ** digit) pairs for every square, indexed by square.
+square_instances = [[] for _ in range(64)]
+for instance, (_, squares) in enumerate(pattern_instances):
+    for digit, square in enumerate(squares):
+        square_instances[square].append((instance, 3 ** digit))
+
+
+def get_pattern_indexes(black, white):
+    """
+        Calculates the index of every pattern instance from scratch.
+    """
+    indexes = [0] * len(pattern_instances)
+    for square in iter_squares(black):
+        for instance, power in square_instances[square]:
+            indexes[instance] += power
+    for square in iter_squares(white):
+        for instance, power in square_instances[square]:
+            indexes[instance] += 2 * power
+    return indexes
+
+
+class PatternIndexes(GameTracker):
+    """
+        Keeps the index of every pattern instance up to date as discs are placed and flipped,
+        so the pattern evaluator doesn't have to read the patterns off the board on every call.
+        A placed disc adds player * 3 ** digit to the index of each instance that covers its
+        square, and a flipped disc adds or removes 3 ** digit (black is 1, white is 2).
+    """
+    def __init__(self):
+        self.indexes = [0] * len(pattern_instances)
+
+    def on_reset(self, black, white):
+        self.indexes = get_pattern_indexes(black, white)
+
+    def on_place(self, square, player):
+        indexes = self.indexes
+        for instance, power in square_instances[square]:
+            indexes[instance] += player * power
+
+    def on_remove(self, square, player):
+        indexes = self.indexes
+        for instance, power in square_instances[square]:
+            indexes[instance] -= player * power
+
+    def on_flip(self, flips, player):
+        indexes = self.indexes
+        while flips:
+            low = flips & -flips
+            flips ^= low
+            if player == 1:
+                for instance, power in square_instances[low.bit_length() - 1]:
+                    indexes[instance] -= power
+            else:
+                for instance, power in square_instances[low.bit_length() - 1]:
+                    indexes[instance] += power
+
+
+# ==============================================================================================
+# ----------------------------- Weight tables of the patterns ----------------------------------
+# ----------------------------------------------------------------------------------------------
+# The weights are signed 16 bit ints, from black's point of view. The table of a pattern
+# has 3 ** len(pattern) weights, and every phase has its own table for each pattern.
+
+def get_table_sizes():
+    return [3 ** len(patterns[name]) for name in pattern_names]
+
+
+def get_default_tables(scale=12):
+    """
+        Returns the tables of one phase, seeded from square_static_weights: the weight of an
+        index is the sum of the static weights of black's squares minus white's squares in the
+        pattern. A square's weight is divided between all the instances that cover it, so the
+        sum over all the instances is scale times the static weights evaluation.
+        The static weights don't depend on the phase, so these tables are the same for every
+        phase: the phases only differ with weights from a file (see load_pattern_weights).
+    """
+    coverage = [len(square_instances[square]) for square in range(64)]
+    tables = []
+    for name in pattern_names:
+        table = [0.0]
+        for i, j in patterns[name]:
+            value = scale * square_static_weights[i][j] / coverage[move_to_square(i, j)]
+            table = table + [weight + value for weight in table] + [weight - value for weight in table]
+        tables.append(array('h', [round(weight) for weight in table]))
+    return tables
+
+
+def load_pattern_weights(path):
+    """
+        Loads the tables of all the phases from a file written by save_pattern_weights.
+        Returns a list of tables for each phase.
+    """
+    sizes = get_table_sizes()
+    weights = []
+    with open(path, "rb") as f:
+        for _ in range(phase_count):
+            tables = []
+            for size in sizes:
+                table = array('h')
+                table.fromfile(f, size)
+                tables.append(table)
+            weights.append(tables)
+        if f.read(1):
+            raise ValueError(f"{path} isn't a pattern weights file, it's too long.")
+    return weights
+
+
+def save_pattern_weights(weights, path):
+    """
+        Saves the tables of all the phases to path as raw 16 bit ints.
+    """
+    with open(path, "wb") as f:
+        for tables in weights:
+            for table in tables:
+                table.tofile(f)
@@ -0,0 +1,227 @@
+import random
+import time
+from Game.util import *
+from Game.game import *
+
+
+# ==============================================================================================
+# ----------------------------------- Playout engine -------------------------------------------
+# ----------------------------------------------------------------------------------------------
+
+# Squares next to a corner, see the policy of PlayoutEngine.choose_square.
+avoided_squares_mask = bad_moves_mask | very_bad_moves_mask
+
+
+class PlayoutEngine:
+    """
+        Plays random games to the end (playouts) for MCTSPlayer.
+        A playout runs on the two bitboards of the position (own: the player to move, opp: the
+        opponent), so the game is read once and never copied, and a pass is just a swap of the
+        two boards.
+        The moves are semi random, the squares next to a corner are played less, see choose_square.
+        seed: the seed of the engine's own random generator, or None to seed it from the system.
+              A seeded engine plays the same playouts every time.
+        Counters: playouts and playout_time (seconds), see get_playouts_per_second.
+    """
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.playouts = 0
+        self.playout_time = 0
+
+    def rollout(self, game, num_sims):
+        """
+            Plays num_sims playouts from game.
+            Returns (wins, loss, draws, elapsed): the playouts won, lost and drawn by the player to
+            move in game, and the seconds they took.
+        """
+        player = game.current_player
+        return self.rollout_position(game.bitboards[player], game.bitboards[3 - player], num_sims)
+
+    def rollout_position(self, own, opp, num_sims):
+        """
+            Same as rollout, for the position of the bitboards own (the player to move) and opp.
+        """
+        wins, draws = 0, 0
+        start = time.perf_counter()
+        for _ in range(num_sims):
+            disc_difference = self.playout(own, opp)
+            if disc_difference > 0:
+                wins += 1
+            elif disc_difference == 0:
+                draws += 1
+        elapsed = time.perf_counter() - start
+        self.playouts += num_sims
+        self.playout_time += elapsed
+        return wins, num_sims - wins - draws, draws, elapsed
+
+    def playout(self, own, opp):
+        """
+            Plays one game from the position to the end.
+            Returns own's final disc difference.
+        """
+        choose_square = self.choose_square
+        sign = 1
+        passed = False
+        while True:
+            moves = get_moves_mask(own, opp)
+            if not moves:
+                if passed:
+                    break
+                own, opp, sign = opp, own, -sign
+                passed = True
+                continue
+            passed = False
+            square = choose_square(moves)
+            flips = get_flips(own, opp, square)
+            own, opp, sign = opp & ~flips, own | flips | (1 << square), -sign
+        return sign * (popcount(own) - popcount(opp))
+
+    def choose_square(self, moves):
+        """
+            Picks a random move. When the move is next to a corner another one is picked, and when
+            that one is diagonally next to a corner (an X-square) another one again, so the squares
+            that give corners away are played less often.
+        """
+        count = moves.bit_count()
+        square = self.pick_square(moves, count)
+        if (1 << square) & avoided_squares_mask:
+            square = self.pick_square(moves, count)
+            if (1 << square) & very_bad_moves_mask:
+                square = self.pick_square(moves, count)
+        return square
+
+    def pick_square(self, moves, count):
+        """
+            Returns a random square of the count squares in moves, without listing them.
+        """
+        for _ in range(int(self.rng.random() * count)):
+            moves &= moves - 1
+        return (moves & -moves).bit_length() - 1
+
+    def get_playouts_per_second(self):
+        return self.playouts / self.playout_time if self.playout_time else 0
+
+
+# ==============================================================================================
+# ------------------------------ Batched NumPy playouts ----------------------------------------
+# ----------------------------------------------------------------------------------------------
+
+# (shift, mask of the discs a line can run through) for the 8 directions. A positive shift is a
+# shift to higher squares. Lines that move along a row can't run through the edge columns, or
+# the shift would wrap them around to the next row.
+shift_directions = [
+    (1, INNER_COLUMNS_MASK), (-1, INNER_COLUMNS_MASK),
+    (8, FULL_MASK), (-8, FULL_MASK),
+    (7, INNER_COLUMNS_MASK), (-7, INNER_COLUMNS_MASK),
+    (9, INNER_COLUMNS_MASK), (-9, INNER_COLUMNS_MASK),
+]
+
+
+class NumpyPlayoutEngine(PlayoutEngine):
+    """
+        A PlayoutEngine that plays all the playouts of a rollout at the same time, in lockstep, with
+        every game's bitboards in NumPy arrays. Every step plays a move (or a pass) in all the
+        games that aren't done, so the Python work is per step instead of per game and per move.
+        The moves follow the same policy as PlayoutEngine.choose_square.
+        A step costs about the same for one game as for thousands, so this pays off with a
+        num_sims in the hundreds or more.
+        NumPy is imported when the engine is made, so it's only needed by players that use it.
+    """
+    def __init__(self, seed=None):
+        super().__init__(seed)
+        import numpy as np
+        self.np = np
+        self.np_rng = np.random.default_rng(self.rng.getrandbits(64))
+        self.square_bits = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+        self.avoided = (self.square_bits & np.uint64(avoided_squares_mask)) != 0
+        self.very_bad = (self.square_bits & np.uint64(very_bad_moves_mask)) != 0
+        self.directions = [(np.uint64(abs(shift)), shift > 0, np.uint64(mask)) for shift, mask in shift_directions]
+
+    def rollout_position(self, own, opp, num_sims):
+        """
+            Plays num_sims playouts from the position at the same time.
+            Returns (wins, loss, draws, elapsed) for own, the player to move, like PlayoutEngine.rollout.
+        """
+        np = self.np
+        start = time.perf_counter()
+        own = np.full(num_sims, own, dtype=np.uint64)
+        opp = np.full(num_sims, opp, dtype=np.uint64)
+        # 1 in the games where own is to move, -1 where the opponent is
+        sign = np.ones(num_sims, dtype=np.int64)
+        passed = np.zeros(num_sims, dtype=bool)
+        wins, draws = 0, 0
+        while own.size:
+            moves = self.get_moves(own, opp)
+            stuck = moves == 0
+            over = stuck & passed
+            if over.any():
+                disc_difference = sign[over] * (np.bitwise_count(own[over]).astype(np.int64) - np.bitwise_count(opp[over]))
+                wins += int((disc_difference > 0).sum())
+                draws += int((disc_difference == 0).sum())
+                live = ~over
+                own, opp, sign, moves, stuck = own[live], opp[live], sign[live], moves[live], stuck[live]
+            # A game without moves passes: its move is empty, and the boards are swapped all the same
+            move_bits = np.where(stuck, np.uint64(0), self.square_bits[self.choose_squares(moves)])
+            flips = self.get_flips(own, opp, move_bits)
+            own, opp = opp & ~flips, own | flips | move_bits
+            sign = -sign
+            passed = stuck
+        elapsed = time.perf_counter() - start
+        self.playouts += num_sims
+        self.playout_time += elapsed
+        return wins, num_sims - wins - draws, draws, elapsed
+
+    def shift(self, bits, amount, up):
+        return bits << amount if up else bits >> amount
+
+    def get_moves(self, own, opp):
+        """
+            Returns the moves mask of own in every game, like get_moves_mask.
+        """
+        shift = self.shift
+        empty = ~(own | opp)
+        moves = self.np.zeros_like(own)
+        for amount, up, mask in self.directions:
+            run_through = opp & mask
+            line = shift(own, amount, up) & run_through
+            for _ in range(5):
+                line |= shift(line, amount, up) & run_through
+            moves |= shift(line, amount, up) & empty
+        return moves
+
+    def get_flips(self, own, opp, move_bits):
+        """
+            Returns the discs captured by the move in move_bits in every game, like get_flips.
+        """
+        np = self.np
+        shift = self.shift
+        flips = np.zeros_like(own)
+        for amount, up, mask in self.directions:
+            run_through = opp & mask
+            line = shift(move_bits, amount, up) & run_through
+            for _ in range(5):
+                line |= shift(line, amount, up) & run_through
+            closed = (shift(line, amount, up) & own) != 0
+            flips |= np.where(closed, line, np.uint64(0))
+        return flips
+
+    def choose_squares(self, moves):
+        """
+            Picks a square out of the moves of every game with the policy of choose_square.
+            Games without moves get square 0.
+        """
+        np = self.np
+        bits = (moves[:, None] & self.square_bits) != 0
+        counts = np.cumsum(bits, axis=1)
+        total = counts[:, -1]
+
+        def pick():
+            k = (self.np_rng.random(len(moves)) * total).astype(np.int64)
+            return np.argmax(counts > k[:, None], axis=1)
+
+        squares = pick()
+        again = self.avoided[squares]
+        second = pick()
+        squares = np.where(again, second, squares)
+        again &= self.very_bad[second]
+        return np.where(again, pick(), squares)
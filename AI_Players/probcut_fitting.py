@@ -0,0 +1,136 @@
+"""
+    Offline script that fits the Multi-ProbCut parameters of MinimaxPlayer (see ProbCut) from
+    self-play positions. Run it from the project's folder (the players read openings_book.txt):
+
+        python -m AI_Players.probcut_fitting --games 50 --positions 1000 --workers 4
+
+    For every sampled position it searches to every depth of probcut_depth_pairs and to the
+    shallow depth paired with it, and fits deep = a * shallow + b by least squares for every
+    (phase, depth), with sigma the standard deviation of the errors.
+    The searches use the same evaluator the player will use, since the parameters only fit the
+    scores of that evaluator (--weights, like RealtimeEvaluator(weights_path)).
+    The GUI loads the parameters by itself when they're saved to probcut_file (the default).
+    NumPy is only needed by the fitting, so it's imported there.
+"""
+import argparse
+import json
+import random
+from multiprocessing import Pool
+from Game.util import *
+from Game.game import *
+from AI_Players.ai_helper import *
+from AI_Players.ai_players import *
+from AI_Players.weight_fitting import generate_positions
+
+
+# The depths that are cut, and the depth of the shallow search that tests each of them. Scores
+# swing between odd and even depths, so each pair has the same parity.
+probcut_depth_pairs = {3: 1, 4: 2, 5: 1, 6: 2}
+
+# A (phase, depth) needs at least this many positions for its model to be saved.
+min_samples = 20
+
+
+def search_scores(player, black, white, current_player, depths):
+    """
+        Searches the position to each of depths with the full window, without ProbCut, with
+        player (a MinimaxPlayer).
+        Returns a dict of {depth: score} from the point of view of the player to move, or None
+        if a score is decisive (the end of the game was found, not estimated).
+    """
+    game = Game.from_bitboards(black, white, current_player)
+    scores = {}
+    for depth in depths:
+        # A deeper search's entries would answer the shallower searches, so every depth starts
+        # with an empty table.
+        player.transposition_table.clear()
+        player.clear_move_ordering()
+        score = player.negamax(game, depth, float("-inf"), float("inf"))
+        if abs(score) >= win_score:
+            return None
+        scores[depth] = score
+    return scores
+
+
+# The player of a process of compute_scores' pool. It's made once per process and searches all
+# the process's positions, so its table is only allocated once. The searches are shallow, a
+# small table is enough for them.
+_worker_player = None
+
+def _init_worker(weights_path):
+    global _worker_player
+    _worker_player = MinimaxPlayer(1, evaluator=RealtimeEvaluator(weights_path), tt_size_mb=1)
+
+def _search_scores(args):
+    return args[:3], search_scores(_worker_player, *args)
+
+def compute_scores(positions, workers=4, depth_pairs=probcut_depth_pairs, weights_path=None):
+    """
+        Searches the positions in workers processes.
+        Returns a list of (phase, {depth: score}) for every position without a decisive score.
+    """
+    depths = sorted(set(depth_pairs) | set(depth_pairs.values()))
+    tasks = [(black, white, player, depths) for black, white, player, _ in positions]
+    samples = []
+    with Pool(workers, initializer=_init_worker, initargs=(weights_path,)) as pool:
+        for (black, white, _), scores in pool.imap_unordered(_search_scores, tasks):
+            if scores is not None:
+                samples.append((get_phase(popcount(black | white)), scores))
+    return samples
+
+
+def fit_probcut(samples, depth_pairs=probcut_depth_pairs):
+    """
+        Fits the model of every (phase, depth) with enough samples.
+        Returns a list of dicts in the format ProbCut.load_params reads.
+    """
+    import numpy as np
+
+    pairs = []
+    for phase in range(phase_count):
+        phase_samples = [scores for sample_phase, scores in samples if sample_phase == phase]
+        if len(phase_samples) < min_samples:
+            continue
+        for depth, shallow_depth in depth_pairs.items():
+            shallow = np.array([scores[shallow_depth] for scores in phase_samples], dtype=float)
+            deep = np.array([scores[depth] for scores in phase_samples], dtype=float)
+            a, b = np.polyfit(shallow, deep, 1)
+            if a <= 0:
+                continue
+            sigma = float(np.std(deep - (a * shallow + b)))
+            pairs.append({
+                "phase": phase, "depth": depth, "shallow_depth": shallow_depth,
+                "a": float(a), "b": float(b), "sigma": sigma,
+            })
+    return pairs
+
+def save_probcut_params(pairs, path):
+    """
+        Writes the parameters in the format ProbCut.load_params reads.
+    """
+    with open(path, "w") as f:
+        json.dump({"pairs": pairs}, f, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the Multi-ProbCut parameters of MinimaxPlayer.")
+    parser.add_argument("--games", type=int, default=50, help="number of self-play games")
+    parser.add_argument("--positions", type=int, default=1000, help="number of positions to sample from the games")
+    parser.add_argument("--workers", type=int, default=4, help="number of processes")
+    parser.add_argument("--weights", default=None, help="weights file of RealtimeEvaluator")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=probcut_file)
+    args = parser.parse_args()
+
+    positions = generate_positions(args.games, args.workers, seed=args.seed)
+    random.seed(args.seed)
+    positions = random.sample(positions, min(args.positions, len(positions)))
+    print(f"Searching {len(positions)} positions from {args.games} games.")
+    samples = compute_scores(positions, args.workers, weights_path=args.weights)
+    pairs = fit_probcut(samples)
+    save_probcut_params(pairs, args.out)
+    print(f"Saved {len(pairs)} models to {args.out}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+    Offline pipeline that fits the weights of RealtimeEvaluator from self-play games.
+    Run it from the project's folder (the players read openings_book.txt):
+
+        python -m AI_Players.weight_fitting --games 400 --workers 4
+
+    The pipeline has three stages:
+        1. generate_positions plays games between the existing players in several processes and
+           labels every position with the final disc difference of its game.
+        2. compute_features calculates the evaluator's features of every position as NumPy arrays.
+        3. fit_weights fits the weights of every timing by regularized least squares.
+    The weights file it writes is loaded with RealtimeEvaluator(weights_path), and the GUI loads
+    it by itself when it's saved to realtime_weights_file (the default).
+    NumPy is only needed by this pipeline, so it's imported by the stages that use it.
+"""
+import argparse
+import json
+import random
+from multiprocessing import Pool
+from Game.util import *
+from Game.game import *
+from AI_Players.ai_helper import *
+from AI_Players.ai_players import *
+
+
+# Disc counts the fitted weights are given for. RealtimeEvaluator interpolates the weights
+# between them, and uses the first list for the disc counts after the last one, so the
+# timings have to run up to a full board.
+fitted_timings_list = [0] + list(range(8, 65, 4))
+
+# The targets are the final disc differences times label_scale, which keeps the fitted
+# weights in the same range as the hand-picked ones (RealtimeEvaluator rounds them to ints).
+label_scale = 1000
+
+
+# ==============================================================================================
+# ------------------------- Stage 1: labeled positions from self-play --------------------------
+# ----------------------------------------------------------------------------------------------
+
+def get_player(name, color, depth):
+    """
+        Returns a player object by the name of its class, like Board.get_player in GUI.graphics.
+    """
+    if name == "RandomPlayer":
+        return RandomPlayer(color, name)
+    elif name == "GreedyPlayer":
+        return GreedyPlayer(color, name)
+    elif name == "MinimaxPlayer":
+        return MinimaxPlayer(color=color, name=name, evaluator=RealtimeEvaluator(), depth=depth)
+    raise ValueError(f"{name} can't be used for self-play.")
+
+def play_game(seed, player_names, depth, random_moves):
+    """
+        Plays one game and returns (positions, disc difference), where positions is a list of
+        (black, white, current_player) before every move and the disc difference is black's.
+        The first random_moves moves are played randomly so the games don't repeat.
+    """
+    random.seed(seed)
+    names = random.sample(player_names, 2) if len(player_names) > 1 else player_names * 2
+    players = [None, get_player(names[0], 1, depth), get_player(names[1], 2, depth)]
+    game = Game()
+    positions = []
+    while not game.is_game_over():
+        player = game.current_player
+        moves = game.get_moves_mask(player)
+        if not moves:
+            game.switch_player()
+            continue
+        positions.append((game.bitboards[1], game.bitboards[2], player))
+        if len(game.move_sequence) < 2 * random_moves:
+            i, j = square_to_move(random.choice(list(iter_squares(moves))))
+        else:
+            i, j = players[player].find_move(game)
+        game.play(i, j, player, "")
+    return positions, game.black_score - game.white_score
+
+def _play_game(args):
+    return play_game(*args)
+
+def generate_positions(num_games, workers=4, player_names=("MinimaxPlayer",),
+                       depth=2, random_moves=8, seed=0):
+    """
+        Plays num_games games in workers processes.
+        Returns a list of (black, white, current_player, disc difference) for every position.
+    """
+    tasks = [(seed + k, list(player_names), depth, random_moves) for k in range(num_games)]
+    positions = []
+    with Pool(workers) as pool:
+        for game_positions, disc_difference in pool.imap_unordered(_play_game, tasks):
+            positions.extend((black, white, player, disc_difference) for black, white, player in game_positions)
+    return positions
+
+
+# ==============================================================================================
+# -------------------------------- Stage 2: features -------------------------------------------
+# ----------------------------------------------------------------------------------------------
+
+def compute_features(positions):
+    """
+        Calculates the features of RealtimeEvaluator (see RealtimeEvaluator.get_features) of every
+        position from the point of view of both players, since the search evaluates positions for
+        the player it searches for, whoever is to move.
+        Returns (features, labels, disc_counts) as NumPy arrays, labels are the final disc
+        differences of the player the features are for.
+    """
+    import numpy as np
+
+    evaluator = RealtimeEvaluator()
+    features, labels, disc_counts = [], [], []
+    for black, white, current_player, disc_difference in positions:
+        game = Game.from_bitboards(black, white, current_player)
+        for player in [1, 2]:
+            features.append(evaluator.get_features(game, player))
+            labels.append(disc_difference if player == 1 else -disc_difference)
+            disc_counts.append(game.get_total_disk_count())
+    return np.array(features, dtype=float), np.array(labels, dtype=float), np.array(disc_counts)
+
+
+# ==============================================================================================
+# ------------------------------- Stage 3: fitting ---------------------------------------------
+# ----------------------------------------------------------------------------------------------
+
+def get_interpolated_features(features, disc_counts, timings_list):
+    """
+        RealtimeEvaluator weighs the features of a position with a mix of the weights of the two
+        timings around its disc count, so its value is linear in the weights of all the timings.
+        Returns the features spread over the weights of every timing, one row per position, so
+        all the timings are fitted together exactly as the evaluator uses them.
+    """
+    import numpy as np
+
+    count, size = features.shape
+    spread = np.zeros((count, size * len(timings_list)))
+    for row in range(count):
+        dc = disc_counts[row]
+        timing = next(i for i, t in enumerate(timings_list) if dc <= t)
+        if timing == 0:
+            spread[row, :size] = features[row]
+            continue
+        factor = (dc - timings_list[timing - 1]) / (timings_list[timing] - timings_list[timing - 1])
+        spread[row, (timing - 1) * size: timing * size] = (1 - factor) * features[row]
+        spread[row, timing * size: (timing + 1) * size] = factor * features[row]
+    return spread
+
+def fit_weights(features, labels, disc_counts, timings_list=fitted_timings_list, regularization=0.1):
+    """
+        Fits the weights of every timing by ridge regression of the scaled labels on the features.
+        regularization is multiplied by the number of positions, so it means the same thing for
+        any amount of data.
+        Returns a weights list with a list of int weights for every timing.
+    """
+    import numpy as np
+
+    spread = get_interpolated_features(features, disc_counts, timings_list)
+    targets = label_scale * labels
+    gram = spread.T @ spread + regularization * len(labels) * np.eye(spread.shape[1])
+    weights = np.linalg.solve(gram, spread.T @ targets)
+    size = features.shape[1]
+    return [[int(round(w)) for w in weights[k * size: (k + 1) * size]] for k in range(len(timings_list))]
+
+def save_weights(weights_list, timings_list, path):
+    """
+        Writes the weights in the format RealtimeEvaluator.load_weights reads.
+    """
+    with open(path, "w") as f:
+        json.dump({"timings_list": timings_list, "weights_list": weights_list}, f, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the weights of RealtimeEvaluator from self-play games.")
+    parser.add_argument("--games", type=int, default=200, help="number of self-play games")
+    parser.add_argument("--workers", type=int, default=4, help="number of processes playing games")
+    parser.add_argument("--players", nargs="+", default=["MinimaxPlayer"],
+                        help="players to pick the two sides of every game from")
+    parser.add_argument("--depth", type=int, default=2, help="depth of MinimaxPlayer")
+    parser.add_argument("--random-moves", type=int, default=8, help="random moves at the start of every game")
+    parser.add_argument("--regularization", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=realtime_weights_file)
+    args = parser.parse_args()
+
+    positions = generate_positions(args.games, args.workers, args.players, args.depth, args.random_moves, args.seed)
+    print(f"Generated {len(positions)} positions from {args.games} games.")
+    features, labels, disc_counts = compute_features(positions)
+    weights = fit_weights(features, labels, disc_counts, regularization=args.regularization)
+    save_weights(weights, fitted_timings_list, args.out)
+    print(f"Saved the weights to {args.out}.")
+
+
+if __name__ == "__main__":
+    main()
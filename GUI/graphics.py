@@ -133,6 +133,7 @@ class Window:
     
     def close(self):
         self.__running = False
+        self.__board.stop_pondering()
         # self.save_game()
     
     # --------------- UI methods
@@ -240,6 +241,7 @@ class Window:
         """
             Method to start a game.
         """
+        self.__board.stop_pondering()
         self.restart_canvas()
         self.__board = Board(self, p1, p2)
         self.initialize_ui_text()
@@ -250,13 +252,15 @@ class Window:
     def replay_game(self):
         """
             The method for the 'Replay' menu command. We switch the players' colors and restart a game switching players' turns.
+            The same players play again, so AI players keep what their searches learned.
         """
         if not self.__board.game_in_progress:
             raise Exception("Can't replay game if you haven't played yet!")
+        self.__board.stop_pondering()
         p1 = self.__board.players[1]
         p2 = self.__board.players[2]
-        p1 = self.get_player(p1.name, 2)
-        p2 = self.get_player(p2.name, 1)
+        p1.color = 2
+        p2.color = 1
         self.start_game(p2, p1)
     
     def get_save_file_name(self, name1, name2):
@@ -366,24 +370,42 @@ class Window:
         if name == "RandomPlayer":
             return RandomPlayer(color, name)
         elif name == "MinimaxPlayer":
-            return MinimaxPlayer(color=color, name=name, evaluator=RealtimeEvaluator(), depth=6)
+            weights_path = realtime_weights_file if os.path.exists(realtime_weights_file) else None
+            probcut = ProbCut(probcut_file) if os.path.exists(probcut_file) else None
+            return MinimaxPlayer(color=color, name=name, evaluator=RealtimeEvaluator(weights_path), time_limit=2000, ponder=True,
+                                 probcut=probcut)
         elif name == "MCTSPlayer":
-            return MCTSPlayer(color=color, name=name, num_sims=20, max_iter=50)
+            return MCTSPlayer(color=color, name=name, num_sims=20, max_iter=50, ponder=True)
         elif name == "GreedyPlayer":
             return GreedyPlayer(color, name)
         else:
             return Player(color, name)
 
+    def get_engine(self, name, color, engines):
+        """
+            Returns the AI player with the name from engines (the players of the last game), so it
+            keeps what its searches learned, or a new player if there isn't one.
+            A reused player is taken out of engines, so two players never share one object.
+        """
+        for engine in engines:
+            if engine.type == "AI" and engine.name == name:
+                engines.remove(engine)
+                engine.color = color
+                return engine
+        return self.get_player(name, color)
+
     def load_game_file(self, temp_win):
         '''
             This method gets the game's details from the save file and recreates the game as it was saved.
         '''
         temp_win.destroy()
+        self.__board.stop_pondering()
         self.restart_canvas()
         path = f"Saved_games/{self.load_name.get()}"
         names, sequence = self.get_save_file_content(path)
-        p1 = self.get_player(names[0], 1)
-        p2 = self.get_player(names[1], 2)
+        engines = self.__board.players[1:] if self.__board.game_in_progress else []
+        p1 = self.get_engine(names[0], 1, engines)
+        p2 = self.get_engine(names[1], 2, engines)
         self.__board = Board(self, p1, p2)
         self.__board.save_name = path
         self.__board.game_saved = True
@@ -393,9 +415,10 @@ class Window:
         self.__board.move_sequence = sequence
         move_count, player = self.populate_board(game, sequence)
         
+        board = game.board
         for i in range(8):
             for j in range(8):
-                self.__board.get_cells()[i][j].owner = game.board[i][j]
+                self.__board.get_cells()[i][j].owner = board[i][j]
         self.__board.score = game.get_score()
         self.__board.move_count = move_count
         self.__board.current_player = player
@@ -663,6 +686,7 @@ class Board:
         """
         if self._win:
             self.__canvas.unbind('<Button-1>')
+        self.stop_pondering()
         print("Game over!")
         if self.score[0] == self.score[1]:
             if self._win:
@@ -682,6 +706,14 @@ class Board:
             self._win.f_canvas.itemconfig(self._win.turn_text, text=f"{winner.name}({color}) has won.")
         return winner.color
     
+    def stop_pondering(self):
+        """
+            Stops the players' pondering, before the game is left for a new one or the window closes.
+        """
+        if self.game_in_progress:
+            for player in self.players[1:]:
+                player.stop_pondering()
+
     def play_move(self, i, j, game, color):
         """
             The method for placing a move on the board.
@@ -706,18 +738,17 @@ class Board:
         if self._win:
             self._win.f_canvas.itemconfig(self._win.turn_text, text=f"{self.players[self.current_player].name}({color})'s turn")
 
-        if self.score[0] + self.score[1] == 64:
+        if game.is_game_over():
             return self.end_game()
         cur_player = self.players[self.current_player]
-        possible_moves = get_possible_moves(game.board, self.current_player)
-        if not possible_moves:
+        if not game.get_moves_mask(self.current_player):
             self.switch_player()
-            possible_moves = get_possible_moves(game.board, self.current_player)
-            if not possible_moves:
-                return self.end_game()
             game.switch_player()
             return self.play(game)
         if cur_player.type == "Human":
+            # The other player can think while a human does. Pondering runs in a thread of this
+            # process, so while an AI searches it would only take half of its time.
+            self.players[3 - self.current_player].start_pondering(game)
             self.__canvas.bind('<Button-1>', lambda e: self.mouse_pressed(e, game, color))
         else:
             move = cur_player.find_move(game)
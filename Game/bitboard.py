@@ -0,0 +1,450 @@
+import random
+
+
+# =============================================================================================
+# ----- Bitboard engine for the game -----------------------------------------------------------
+#
+# A position is stored as two 64-bit ints, one per player. Square (i, j) is bit i * 8 + j,
+# so bit 0 is 'A1' (top left) and bit 63 is 'H8' (bottom right).
+# =============================================================================================
+
+FULL_MASK = 0xFFFFFFFFFFFFFFFF
+
+# All squares except the ones in column A and column H. Opponent discs are masked with it when
+# we shift along a row or a diagonal, so a line can never wrap around the edge of the board.
+INNER_COLUMNS_MASK = 0x7E7E7E7E7E7E7E7E
+
+CORNERS_MASK = 0x8100000000000081
+
+# All squares except the ones in column A / column H.
+NOT_A_FILE = 0xFEFEFEFEFEFEFEFE
+NOT_H_FILE = 0x7F7F7F7F7F7F7F7F
+
+# The bit shift for a step in each direction. Positive shifts move towards bit 63 (down the board),
+# negative shifts move towards bit 0 (up the board).
+# The order matches the order of directions in find_lines.
+SHIFTS = [8, 9, 1, -7, -8, -9, -1, 7]
+
+INITIAL_BLACK = (1 << 28) | (1 << 35)
+INITIAL_WHITE = (1 << 27) | (1 << 36)
+
+
+SQUARE_TO_MOVE = [(square >> 3, square & 7) for square in range(64)]
+
+
+def _get_rays(square):
+    rays = []
+    for di, dj in [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]:
+        i, j = (square >> 3) + di, (square & 7) + dj
+        ray = []
+        while 0 <= i < 8 and 0 <= j < 8:
+            ray.append(1 << (i * 8 + j))
+            i, j = i + di, j + dj
+        if len(ray) >= 2:
+            rays.append(ray)
+    return rays
+
+# RAYS[square] lists the bits of the squares in each direction from square, nearest first.
+# Directions with less than 2 squares can't capture, so they're left out.
+RAYS = [_get_rays(square) for square in range(64)]
+
+
+# Zobrist keys. They come from a fixed seed, so a position has the same hash in every
+# run and in every process, and hashes can be stored on disk.
+_zobrist_random = random.Random(0x5EED)
+# ZOBRIST_KEYS[player][square] is xor-ed in when player owns square.
+ZOBRIST_KEYS = [
+    None,
+    [_zobrist_random.getrandbits(64) for _ in range(64)],
+    [_zobrist_random.getrandbits(64) for _ in range(64)],
+]
+# ZOBRIST_FLIPS[square] changes the owner of square in a hash.
+ZOBRIST_FLIPS = [ZOBRIST_KEYS[1][square] ^ ZOBRIST_KEYS[2][square] for square in range(64)]
+# ZOBRIST_SIDE[player] is xor-ed in for the player to move.
+ZOBRIST_SIDE = [0, 0, _zobrist_random.getrandbits(64)]
+
+
+def square_to_move(square):
+    """
+        Converts a bit index to indexes. For example: 10 => 1, 2
+    """
+    return SQUARE_TO_MOVE[square]
+
+def move_to_square(i, j):
+    """
+        Converts indexes to a bit index. For example: 1, 2 => 10
+    """
+    return i * 8 + j
+
+def popcount(bits):
+    return bits.bit_count()
+
+def iter_squares(bits):
+    """
+        Yields the bit index of every set bit in bits, from bit 0 upwards.
+    """
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+def zobrist_hash(black, white, player=1):
+    """
+        Calculates the Zobrist hash of a position from scratch.
+        player: the player to move.
+    """
+    key = ZOBRIST_SIDE[player]
+    for square in iter_squares(black):
+        key ^= ZOBRIST_KEYS[1][square]
+    for square in iter_squares(white):
+        key ^= ZOBRIST_KEYS[2][square]
+    return key
+
+# ------------------------------------------------------------------------------------------------------
+#       Symmetries of the board
+#
+# The board has 8 symmetries. A transform t (0 - 7) is applied as: if t & 4 transpose the board
+# ((i, j) => (j, i)), then if t & 1 mirror it left to right, then if t & 2 flip it upside down.
+# Transform 0 is the identity.
+# ======================================================================================================
+
+def mirror_horizontal(bits):
+    """
+        Mirrors a bitboard left to right: (i, j) => (i, 7 - j).
+    """
+    bits = ((bits >> 1) & 0x5555555555555555) | ((bits & 0x5555555555555555) << 1)
+    bits = ((bits >> 2) & 0x3333333333333333) | ((bits & 0x3333333333333333) << 2)
+    return ((bits >> 4) & 0x0F0F0F0F0F0F0F0F) | ((bits & 0x0F0F0F0F0F0F0F0F) << 4)
+
+def flip_vertical(bits):
+    """
+        Flips a bitboard upside down: (i, j) => (7 - i, j).
+    """
+    return int.from_bytes(bits.to_bytes(8, "little"), "big")
+
+def transpose(bits):
+    """
+        Flips a bitboard along the A1-H8 diagonal: (i, j) => (j, i).
+    """
+    t = 0x0F0F0F0F00000000 & (bits ^ (bits << 28))
+    bits ^= t ^ (t >> 28)
+    t = 0x3333000033330000 & (bits ^ (bits << 14))
+    bits ^= t ^ (t >> 14)
+    t = 0x5500550055005500 & (bits ^ (bits << 7))
+    return bits ^ t ^ (t >> 7)
+
+def transform_bitboard(bits, transform):
+    if transform & 4:
+        bits = transpose(bits)
+    if transform & 1:
+        bits = mirror_horizontal(bits)
+    if transform & 2:
+        bits = flip_vertical(bits)
+    return bits
+
+def _transform_square(square, transform):
+    i, j = square >> 3, square & 7
+    if transform & 4:
+        i, j = j, i
+    if transform & 1:
+        j = 7 - j
+    if transform & 2:
+        i = 7 - i
+    return i * 8 + j
+
+# TRANSFORM_SQUARES[transform][square] is the square that square is moved to by transform.
+TRANSFORM_SQUARES = [[_transform_square(square, t) for square in range(64)] for t in range(8)]
+
+# INVERSE_TRANSFORMS[transform] is the transform that undoes transform.
+INVERSE_TRANSFORMS = [t if not t & 4 else 4 | ((t & 1) << 1) | ((t & 2) >> 1) for t in range(8)]
+
+# The transforms that leave the initial position unchanged.
+INITIAL_POSITION_TRANSFORMS = [0, 3, 4, 7]
+
+
+def transform_square(square, transform):
+    return TRANSFORM_SQUARES[transform][square]
+
+def get_symmetries(black, white):
+    """
+        Returns a list of the (black, white) bitboards of the position under each of the 8 transforms,
+        indexed by transform.
+    """
+    black_t, white_t = transpose(black), transpose(white)
+    symmetries = []
+    for b, w in ((black, white), (black_t, white_t)):
+        b_m, w_m = mirror_horizontal(b), mirror_horizontal(w)
+        symmetries.append((b, w))
+        symmetries.append((b_m, w_m))
+        symmetries.append((flip_vertical(b), flip_vertical(w)))
+        symmetries.append((flip_vertical(b_m), flip_vertical(w_m)))
+    return symmetries
+
+def canonicalize(black, white):
+    """
+        Maps a position to its canonical orientation: the smallest (black, white) pair among
+        its 8 symmetries. All symmetric positions have the same canonical orientation.
+        Returns (black, white, transform), where transform maps the position to the canonical one.
+        Moves found on the canonical position are mapped back with INVERSE_TRANSFORMS[transform].
+    """
+    best, best_transform = (black, white), 0
+    for transform, position in enumerate(get_symmetries(black, white)):
+        if position < best:
+            best, best_transform = position, transform
+    return best[0], best[1], best_transform
+
+def board_to_bitboards(board):
+    """
+        Converts a list of lists of 0, 1 or 2 to the (black, white) bitboards.
+    """
+    black, white = 0, 0
+    bit = 1
+    for row in board:
+        for square in row:
+            if square == 1:
+                black |= bit
+            elif square == 2:
+                white |= bit
+            bit <<= 1
+    return black, white
+
+def bitboards_to_board(black, white):
+    """
+        Converts the (black, white) bitboards to a list of lists of 0, 1 or 2.
+    """
+    board = []
+    bit = 1
+    for _ in range(8):
+        row = []
+        for _ in range(8):
+            if black & bit:
+                row.append(1)
+            elif white & bit:
+                row.append(2)
+            else:
+                row.append(0)
+            bit <<= 1
+        board.append(row)
+    return board
+
+
+# ------------------------------------------------------------------------------------------------------
+#       Move generation
+# ======================================================================================================
+
+def get_moves_mask(own, opp):
+    """
+        Returns a mask of all the squares own can play on.
+        For each direction, we shift own's discs over a contiguous run of opp's discs
+        and keep the empty squares right after the run. The run is grown two squares at
+        a time after the first two steps, so every direction takes 4 steps instead of 6.
+    """
+    inner = opp & INNER_COLUMNS_MASK
+
+    # horizontal
+    l = inner & (own << 1)
+    r = inner & (own >> 1)
+    l |= inner & (l << 1)
+    r |= inner & (r >> 1)
+    pl = inner & (inner << 1)
+    pr = pl >> 1
+    l |= pl & (l << 2)
+    r |= pr & (r >> 2)
+    l |= pl & (l << 2)
+    r |= pr & (r >> 2)
+    moves = (l << 1) | (r >> 1)
+
+    # vertical
+    l = opp & (own << 8)
+    r = opp & (own >> 8)
+    l |= opp & (l << 8)
+    r |= opp & (r >> 8)
+    pl = opp & (opp << 8)
+    pr = pl >> 8
+    l |= pl & (l << 16)
+    r |= pr & (r >> 16)
+    l |= pl & (l << 16)
+    r |= pr & (r >> 16)
+    moves |= (l << 8) | (r >> 8)
+
+    # diagonals
+    l = inner & (own << 7)
+    r = inner & (own >> 7)
+    l |= inner & (l << 7)
+    r |= inner & (r >> 7)
+    pl = inner & (inner << 7)
+    pr = pl >> 7
+    l |= pl & (l << 14)
+    r |= pr & (r >> 14)
+    l |= pl & (l << 14)
+    r |= pr & (r >> 14)
+    moves |= (l << 7) | (r >> 7)
+
+    l = inner & (own << 9)
+    r = inner & (own >> 9)
+    l |= inner & (l << 9)
+    r |= inner & (r >> 9)
+    pl = inner & (inner << 9)
+    pr = pl >> 9
+    l |= pl & (l << 18)
+    r |= pr & (r >> 18)
+    l |= pl & (l << 18)
+    r |= pr & (r >> 18)
+    moves |= (l << 9) | (r >> 9)
+
+    return moves & ~(own | opp) & FULL_MASK
+
+def get_neighbours_mask(bits):
+    """
+        Returns a mask of all the squares next to a square in bits, in any of the 8 directions.
+    """
+    row = bits | ((bits << 1) & NOT_A_FILE) | ((bits >> 1) & NOT_H_FILE)
+    return (row | (row << 8) | (row >> 8)) & FULL_MASK
+
+# ------------------------------------------------------------------------------------------------------
+#       Stability
+# ======================================================================================================
+
+EDGES_MASK = 0xFF818181818181FF
+
+ROW_MASKS = [0xFF << (8 * i) for i in range(8)]
+# Masks of the diagonals going (i + 1, j + 1) and of the diagonals going (i + 1, j - 1).
+DIAGONAL_MASKS = [
+    sum(1 << (i * 8 + j) for i in range(8) for j in range(8) if i - j == d) for d in range(-7, 8)
+]
+ANTI_DIAGONAL_MASKS = [
+    sum(1 << (i * 8 + j) for i in range(8) for j in range(8) if i + j == d) for d in range(15)
+]
+
+
+def get_full_lines(filled):
+    """
+        Returns the masks of the squares whose line is completely filled in each direction:
+        (horizontal, vertical, diagonal, anti-diagonal). A disc can never be flipped along a full line.
+    """
+    horizontal = 0
+    for row in ROW_MASKS:
+        if filled & row == row:
+            horizontal |= row
+    columns = filled & (filled >> 32)
+    columns &= columns >> 16
+    columns &= columns >> 8
+    vertical = (columns & 0xFF) * 0x0101010101010101
+    diagonal = 0
+    for line in DIAGONAL_MASKS:
+        if filled & line == line:
+            diagonal |= line
+    anti_diagonal = 0
+    for line in ANTI_DIAGONAL_MASKS:
+        if filled & line == line:
+            anti_diagonal |= line
+    return horizontal, vertical, diagonal, anti_diagonal
+
+def get_stable_mask(own, opp, full_lines=None):
+    """
+        Returns the mask of own's discs that can never be flipped.
+        A disc can't be flipped along a direction if its line in that direction is full, or if one of
+        its two neighbors in that direction is off the board or a stable disc of own. A disc that is
+        safe in all 4 directions is stable. We start with no stable discs and add discs until nothing
+        changes.
+        full_lines: the result of get_full_lines, if the caller already has it.
+    """
+    if full_lines is None:
+        full_lines = get_full_lines(own | opp)
+    horizontal, vertical, diagonal, anti_diagonal = full_lines
+    # discs safe in every direction without any stable neighbor
+    if not own & (EDGES_MASK | (horizontal & vertical & diagonal & anti_diagonal)):
+        return 0
+    horizontal |= 0x8181818181818181
+    vertical |= 0xFF000000000000FF
+    diagonal |= EDGES_MASK
+    anti_diagonal |= EDGES_MASK
+    stable = 0
+    while True:
+        new_stable = (
+            own
+            & (horizontal | ((stable << 1) & NOT_A_FILE) | ((stable >> 1) & NOT_H_FILE))
+            & (vertical | (stable << 8) | (stable >> 8))
+            & (diagonal | ((stable << 9) & NOT_A_FILE) | ((stable >> 9) & NOT_H_FILE))
+            & (anti_diagonal | ((stable << 7) & NOT_H_FILE) | ((stable >> 7) & NOT_A_FILE))
+        )
+        if new_stable == stable:
+            return stable
+        stable = new_stable
+
+def get_final_score_bounds(own, opp):
+    """
+        Returns (lower, upper) bounds on own's final disc difference (own's discs - opp's discs at the
+        end of the game), from the discs each player is sure to keep.
+    """
+    full_lines = get_full_lines(own | opp)
+    own_stable = popcount(get_stable_mask(own, opp, full_lines))
+    opp_stable = popcount(get_stable_mask(opp, own, full_lines))
+    return 2 * own_stable - 64, 64 - 2 * opp_stable
+
+def get_flip_lines(own, opp, square):
+    """
+        Returns a list with a mask of the discs captured in each direction if own plays on square.
+        Directions with no captured discs are left out.
+    """
+    lines = []
+    inner = opp & INNER_COLUMNS_MASK
+    bit = 1 << square
+    for shift in SHIFTS:
+        o = opp if shift == 8 or shift == -8 else inner
+        line = 0
+        if shift > 0:
+            x = (bit << shift) & o
+            while x:
+                line |= x
+                x <<= shift
+                if x & own:
+                    lines.append(line)
+                    break
+                x &= o
+        else:
+            x = (bit >> -shift) & o
+            while x:
+                line |= x
+                x >>= -shift
+                if x & own:
+                    lines.append(line)
+                    break
+                x &= o
+    return lines
+
+def get_flips(own, opp, square):
+    """
+        Returns a mask of all the discs captured if own plays on square.
+        Walks the rays out of square, which is cheaper than shifting masks for a single square
+        since most rays end at their first square.
+    """
+    flips = 0
+    for ray in RAYS[square]:
+        line = 0
+        for bit in ray:
+            if opp & bit:
+                line |= bit
+            else:
+                if own & bit:
+                    flips |= line
+                break
+    return flips
+
+def mask_to_line(line, square):
+    """
+        Converts a mask of a captured line to a list of (i, j) ordered from square outwards.
+    """
+    squares = [SQUARE_TO_MOVE[sq] for sq in iter_squares(line)]
+    if line < (1 << square):
+        squares.reverse()
+    return squares
+
+def line_to_mask(line):
+    """
+        Converts a list of (i, j) to a mask.
+    """
+    mask = 0
+    for i, j in line:
+        mask |= 1 << (i * 8 + j)
+    return mask
@@ -1,4 +1,7 @@
+import json
 import random
+import threading
+import time
 from time import sleep
 from tkinter import BOTH, BOTTOM, INSERT, RIGHT, TOP, Button, Canvas, Entry, Label, StringVar, Text, font
 from Game.util import *
@@ -21,13 +24,164 @@ class Player:
         """
         pass
 
+    def start_pondering(self, game):
+        """
+            Called when the opponent starts thinking about its move in game.
+            Human players don't use the opponent's time, see AIPlayer.start_pondering.
+        """
+        pass
+
+    def stop_pondering(self):
+        pass
+
+
+class SearchStats:
+    """
+        What an AI player did to find one move, see AIPlayer.stats.
+        player, color: the name and color of the player.
+        empty_count: the number of empty squares when the player had to move.
+        move: the move the player chose, or None.
+        source: how the move was found, e.g. "book" for the opening book or "search".
+        time: the seconds the move took.
+        phase_times: the seconds each phase of the move took, by the name of the phase.
+        counters: the player's own numbers by name, like the nodes a search visited or the
+                  rollouts MCTS simulated, and rates derived from them.
+    """
+    def __init__(self, player, game):
+        self.player = player.name
+        self.color = player.color
+        self.empty_count = game.empty_count
+        self.move = None
+        self.source = None
+        self.time = 0
+        self.phase_times = {}
+        self.counters = {}
+        self.start = self.last_mark = time.perf_counter()
+
+    def mark(self, phase):
+        """
+            Adds the time since the last mark (or the start) to phase.
+        """
+        now = time.perf_counter()
+        self.phase_times[phase] = self.phase_times.get(phase, 0) + now - self.last_mark
+        self.last_mark = now
+
+    def finish(self, move, source):
+        self.move = move
+        self.source = source
+        self.time = time.perf_counter() - self.start
+
+    def to_dict(self):
+        return {
+            "player": self.player,
+            "color": self.color,
+            "empty_count": self.empty_count,
+            "move": list(self.move) if self.move else None,
+            "source": self.source,
+            "time": self.time,
+            "phase_times": self.phase_times,
+            "counters": self.counters,
+        }
+
 
 class AIPlayer(Player):
     """
         The AI player base class. All AI players expand this class.
+        ponder: if True, the player thinks on the opponent's time. start_pondering runs ponder_on
+                in a background thread until stop_pondering is called, and the player uses what it
+                found there when its own turn comes.
+        stats: a SearchStats of the last find_move, or None before the first one.
+        stats_callback, stats_log: see set_stats_hook.
     """
-    def __init__(self, color: int, name, type="AI"):
+    def __init__(self, color: int, name, type="AI", ponder=False):
         super().__init__(color, name, type)
+        self.stats = None
+        self.stats_callback = None
+        self.stats_log = None
+        self.ponder = ponder
+        self.ponder_thread = None
+        self.ponder_position = None
+        self.ponder_stop = threading.Event()
+
+    def set_stats_hook(self, callback=None, log_path=None):
+        """
+            Streams the stats of every move: callback is called with the SearchStats, and a line
+            with the stats as json is appended to the file log_path. Both are off by default, and
+            calling this without arguments turns them off.
+        """
+        self.stats_callback = callback
+        self.stats_log = log_path
+
+    def begin_stats(self, game):
+        """
+            Starts the stats of a move. Called by find_move, which hands its move to end_stats.
+        """
+        self.stats = SearchStats(self, game)
+        return self.stats
+
+    def end_stats(self, move, source):
+        """
+            Finishes the stats of the move, streams them if the hook is set, and returns move.
+        """
+        stats = self.stats
+        stats.finish(move, source)
+        if self.stats_callback:
+            self.stats_callback(stats)
+        if self.stats_log:
+            with open(self.stats_log, "a") as f:
+                f.write(json.dumps(stats.to_dict()) + "\n")
+        return move
+
+    def __getstate__(self):
+        # Copies of the player (deepcopy, pickle) don't share its pondering thread
+        state = self.__dict__.copy()
+        state["ponder_thread"] = None
+        state["ponder_position"] = None
+        del state["ponder_stop"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.ponder_stop = threading.Event()
+
+    def start_pondering(self, game):
+        """
+            Starts pondering on a copy of game, if the player ponders and the opponent is the one
+            to move. Pondering on another position is stopped first, pondering on the same position
+            is left to go on.
+            The pondering thread shares the interpreter with the caller, so it's only worth starting
+            while the opponent is a human: an AI opponent's search would be slowed down as much as
+            pondering gains.
+        """
+        if not self.ponder or game.current_player == self.color or game.is_game_over():
+            return
+        position = (game.bitboards[1], game.bitboards[2], game.current_player)
+        if self.ponder_thread is not None and self.ponder_position == position:
+            return
+        self.stop_pondering()
+        self.ponder_position = position
+        self.ponder_thread = threading.Thread(target=self.ponder_on, args=(game.copy(),), daemon=True)
+        self.ponder_thread.start()
+
+    def stop_pondering(self):
+        """
+            Stops the pondering thread, if it's running, and waits for it to end, so the player's
+            tables are all its own again when this returns.
+        """
+        if self.ponder_thread is None:
+            return
+        self.ponder_stop.set()
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        self.ponder_stop.clear()
+
+    def ponder_on(self, game):
+        """
+            The search to run on the opponent's time, game is the position the opponent has to move
+            in. Only used as a template, players that ponder implement it. It has to return soon
+            after ponder_stop is set.
+        """
+        pass
 
     def get_opening_move(self, game):
         """
@@ -38,62 +192,159 @@ class AIPlayer(Player):
         sequence = game.move_sequence
         openings = get_openings()
         possible_openings = []
-        if not sequence:
-            possible_openings = openings
-        else:
+        # The initial position is symmetric, so the book also covers every game that is a
+        # mirror image of one of its openings. We look the game up in each orientation that
+        # keeps the initial position, and map the book's move back to the game's orientation.
+        for transform in INITIAL_POSITION_TRANSFORMS:
+            transformed_sequence = transform_sequence(sequence, transform)
             for opening in openings:
-                if opening.startswith(sequence) and opening != sequence:
-                    possible_openings.append(opening)
+                if opening.startswith(transformed_sequence) and opening != transformed_sequence:
+                    possible_openings.append((opening, transform))
         if not possible_openings:
             return None
-        opening = possible_openings[random.randrange(0, len(possible_openings))]
+        opening, transform = possible_openings[random.randrange(0, len(possible_openings))]
         i, j = notation_to_move(opening[len(sequence): len(sequence) + 2])
-        return (i, j)
+        square = transform_square(move_to_square(i, j), INVERSE_TRANSFORMS[transform])
+        return square_to_move(square)
         
 
+class GameTracker:
+    """
+        Interface for classes that keep values derived from the discs on the board up to date
+        incrementally, such as the pattern indexes of the pattern evaluator.
+        A tracker is attached to a game with Game.add_tracker and the game notifies it about
+        every change to the discs. Discs are given by square (bit index, see Game.bitboard).
+    """
+    def on_reset(self, black, white):
+        """
+            Called when the whole position is replaced.
+        """
+        pass
+
+    def on_place(self, square, player):
+        """
+            Called when player places a disc on the empty square.
+        """
+        pass
+
+    def on_remove(self, square, player):
+        """
+            Called when player's disc is taken back from square, which becomes empty.
+        """
+        pass
+
+    def on_flip(self, flips, player):
+        """
+            Called when the discs in the flips mask change to player's color.
+        """
+        pass
+
+
 class Game:
     """
         This is the class that defines the game's mechanics.
-        board: a list of lists of 0, 1 or 2, representing the game board.
+        bitboards: [0, black, white], 64-bit masks of the squares occupied by each player,
+                   indexed by player. Square (i, j) is bit i * 8 + j.
+        board: 8 rows of 0, 1 or 2, representing the game board. It is built from the bitboards on
+               every access, as tuples, so writing to it (game.board[i][j] = ...) raises a TypeError
+               instead of being silently lost. Assign a whole board to game.board to set one.
         black_score, white_score: the respective current scores of the players.
         current_player: 1 or 2, representing the player who's placing a move.
         move_sequence: a string of alphanumerics representing the sequence of moves played.
         winner: None (while the game isn't done), 0(draw), 1 or 2. Representing the winner of the game.
+        moves: [0, black_moves, white_moves], cached masks of the squares each player can play on,
+               indexed by player. They are kept up to date by every method that changes the board.
+        empty_count: the number of empty squares on the board.
+        disc_hash: the Zobrist hash of the discs on the board, updated incrementally by every move
+                   and flip. get_hash adds the player to move to it.
+        trackers: {name: GameTracker}, the trackers notified about every change to the discs.
+        The bitboards shouldn't be changed directly, use set_bitboards to keep the cached values right.
     """
     def __init__(self, board=None):
+        self.trackers = {}
         if board:
             self.board = board
-            self.set_score()
         else:
-            self.board = [
-                [0, 0, 0, 0, 0, 0, 0, 0],
-                [0, 0, 0, 0, 0, 0, 0, 0],
-                [0, 0, 0, 0, 0, 0, 0, 0],
-                [0, 0, 0, 2, 1, 0, 0, 0],
-                [0, 0, 0, 1, 2, 0, 0, 0],
-                [0, 0, 0, 0, 0, 0, 0, 0],
-                [0, 0, 0, 0, 0, 0, 0, 0],
-                [0, 0, 0, 0, 0, 0, 0, 0],
-            ]
+            self.bitboards = [0, INITIAL_BLACK, INITIAL_WHITE]
             self.black_score = 2
             self.white_score = 2
+            self.empty_count = 60
+            self.disc_hash = zobrist_hash(INITIAL_BLACK, INITIAL_WHITE)
+            self.set_moves()
         self.current_player = 1
         self.move_sequence = ""
         self.winner = None
+
+    @classmethod
+    def from_bitboards(cls, black, white, current_player=1):
+        """
+            Creates a game from the bitboards of both players.
+        """
+        game = cls()
+        game.set_bitboards(black, white)
+        game.current_player = current_player
+        return game
+
+    @property
+    def board(self):
+        return tuple(map(tuple, bitboards_to_board(self.bitboards[1], self.bitboards[2])))
+
+    @board.setter
+    def board(self, board):
+        self.set_bitboards(*board_to_bitboards(board))
+
+    def set_bitboards(self, black, white):
+        self.bitboards = [0, black, white]
+        self.disc_hash = zobrist_hash(black, white)
+        self.set_score()
+        self.set_moves()
+        for tracker in self.trackers.values():
+            tracker.on_reset(black, white)
     
     def set_score(self):
-        b_score, w_score = 0, 0
-        for row in range(8):
-            for col in range(8):
-                if self.board[row][col] == 1:
-                    b_score += 1
-                elif self.board[row][col] == 2:
-                    w_score += 1
-        self.black_score = b_score
-        self.white_score = w_score
+        self.black_score = popcount(self.bitboards[1])
+        self.white_score = popcount(self.bitboards[2])
+        self.empty_count = 64 - self.black_score - self.white_score
+
+    def set_moves(self):
+        """
+            Recalculates the cached moves of both players from the bitboards.
+        """
+        black, white = self.bitboards[1], self.bitboards[2]
+        self.moves = [0, get_moves_mask(black, white), get_moves_mask(white, black)]
 
     def get_score(self):
         return [self.black_score, self.white_score]
+
+    def get_canonical_key(self):
+        """
+            Returns (key, transform). key is the same for all the positions that are symmetric to
+            this one (with the same player to move), so caches can share their entries.
+            transform maps this position to the canonical one, see canonicalize in Game.bitboard.
+        """
+        black, white, transform = canonicalize(self.bitboards[1], self.bitboards[2])
+        return (black, white, self.current_player), transform
+
+    def add_tracker(self, name, tracker):
+        """
+            Attaches a GameTracker to the game and brings it up to date with the current position.
+        """
+        tracker.on_reset(self.bitboards[1], self.bitboards[2])
+        self.trackers[name] = tracker
+
+    def get_tracker(self, name):
+        """
+            Returns the tracker attached under name, or None.
+        """
+        return self.trackers.get(name)
+
+    def get_hash(self):
+        """
+            Returns the Zobrist hash of the position: the discs on the board and the player to move.
+            The hash is the same in every run, so it can be used as a key for transposition tables,
+            evaluation caches, the openings book or positions stored on disk.
+        """
+        return self.disc_hash ^ ZOBRIST_SIDE[self.current_player]
     
     def switch_player(self):
         self.current_player = abs(self.current_player - 2) + 1
@@ -103,26 +354,67 @@ class Game:
             Updates the board after move by switching the value in the cells to player.
             player: 1 or 2. The player who placed the move.
         """
+        flips = 0
         for line in lines:
-            for i, j in line:
-                self.board[i][j] = player
-                if player == 1:
-                    self.black_score += 1
-                    self.white_score -= 1
-                else:
-                    self.black_score -= 1
-                    self.white_score += 1
+            flips |= line_to_mask(line)
+        self.flip_bits(flips, player)
+
+    def flip_bits(self, flips, player):
+        """
+            Same as flip_disks, but the captured discs are given as a mask.
+        """
+        self.bitboards[player] |= flips
+        self.bitboards[3 - player] &= ~flips
+        for square in iter_squares(flips):
+            self.disc_hash ^= ZOBRIST_FLIPS[square]
+        for tracker in self.trackers.values():
+            tracker.on_flip(flips, player)
+        count = popcount(flips)
+        if player == 1:
+            self.black_score += count
+            self.white_score -= count
+        else:
+            self.black_score -= count
+            self.white_score += count
+        self.set_moves()
     
     def player_disk_count(self, player):
-        disks = 0
-        for row in self.board:
-            for square in row:
-                if square == player:
-                    disks += 1
-        return disks
+        return popcount(self.bitboards[player])
     
     def get_total_disk_count(self):
-        return self.player_disk_count(1) + self.player_disk_count(2)
+        return 64 - self.empty_count
+
+    def get_possible_moves(self, player):
+        """
+            Returns moves dictionary of all possible {move: list(lines)} that player can play.
+            See get_possible_moves in Game.util.
+        """
+        own, opp = self.bitboards[player], self.bitboards[3 - player]
+        return {
+            SQUARE_TO_MOVE[square]: [mask_to_line(line, square) for line in get_flip_lines(own, opp, square)]
+            for square in iter_squares(self.moves[player])
+        }
+
+    def get_moves_mask(self, player):
+        """
+            Returns a mask of all the squares player can play on.
+        """
+        return self.moves[player]
+
+    def get_move_count(self, player):
+        return popcount(self.moves[player])
+
+    def get_legal_moves(self, player):
+        """
+            Returns a list of all the (i, j) player can play on, without the lines they capture.
+        """
+        return [SQUARE_TO_MOVE[square] for square in iter_squares(self.moves[player])]
+
+    def get_flips(self, square, player):
+        """
+            Returns a mask of the discs captured if player plays on square.
+        """
+        return get_flips(self.bitboards[player], self.bitboards[3 - player], square)
 
     def play_move(self, i, j, lines, player):
         """
@@ -131,40 +423,127 @@ class Game:
             Updates current_player to other player.
             If game is over, it sets the winner.
         """
-        self.flip_disks(lines, player)
-        self.board[i][j] = player
+        square = move_to_square(i, j)
+        self.bitboards[player] |= 1 << square
+        self.disc_hash ^= ZOBRIST_KEYS[player][square]
+        for tracker in self.trackers.values():
+            tracker.on_place(square, player)
         if player == 1:
             self.black_score += 1
         else:
             self.white_score += 1
+        self.empty_count -= 1
+        # The disc is placed first, so the moves flip_disks caches are the ones after the move
+        self.flip_disks(lines, player)
         notation = move_to_notation(i, j, player)
         self.move_sequence += notation
         self.switch_player()
         if self.is_game_over():
             self.set_winner()
     
+    def make_move(self, square):
+        """
+            Plays the current player's move on square (bit index, see Game.bitboard) in place.
+            The move isn't validated, the square has to be one of the current player's possible moves.
+            Returns an undo record that unmake_move uses to take the move back exactly.
+        """
+        player = self.current_player
+        bitboards = self.bitboards
+        own, opp = bitboards[player], bitboards[3 - player]
+        flips = get_flips(own, opp, square)
+        moves = self.moves
+        disc_hash = self.disc_hash
+        undo = (square, flips, player, self.winner, self.move_sequence, moves[1], moves[2], disc_hash)
+        disc_hash ^= ZOBRIST_KEYS[player][square]
+        f = flips
+        while f:
+            low = f & -f
+            disc_hash ^= ZOBRIST_FLIPS[low.bit_length() - 1]
+            f ^= low
+        self.disc_hash = disc_hash
+        own |= flips | (1 << square)
+        opp &= ~flips
+        bitboards[player] = own
+        bitboards[3 - player] = opp
+        moves[player] = get_moves_mask(own, opp)
+        moves[3 - player] = get_moves_mask(opp, own)
+        if self.trackers:
+            for tracker in self.trackers.values():
+                tracker.on_place(square, player)
+                tracker.on_flip(flips, player)
+        self.empty_count -= 1
+        count = popcount(flips)
+        if player == 1:
+            self.black_score += count + 1
+            self.white_score -= count
+        else:
+            self.black_score -= count
+            self.white_score += count + 1
+        self.move_sequence += square_notations[player][square]
+        self.current_player = 3 - player
+        if not (moves[1] | moves[2]):
+            self.set_winner()
+        return undo
+
+    def unmake_move(self, undo):
+        """
+            Takes back a move played by make_move, using the undo record it returned.
+            Moves have to be taken back in the reverse order they were made.
+        """
+        square, flips, player, winner, move_sequence, black_moves, white_moves, disc_hash = undo
+        bitboards = self.bitboards
+        bitboards[player] &= ~(flips | (1 << square))
+        bitboards[3 - player] |= flips
+        if self.trackers:
+            for tracker in self.trackers.values():
+                tracker.on_flip(flips, 3 - player)
+                tracker.on_remove(square, player)
+        count = popcount(flips)
+        if player == 1:
+            self.black_score -= count + 1
+            self.white_score += count
+        else:
+            self.black_score += count
+            self.white_score -= count + 1
+        self.move_sequence = move_sequence
+        self.current_player = player
+        self.winner = winner
+        self.moves[1] = black_moves
+        self.moves[2] = white_moves
+        self.empty_count += 1
+        self.disc_hash = disc_hash
+
+    def copy(self):
+        """
+            Returns an independent copy of the game. This is a lot cheaper than deepcopy.
+            The trackers aren't copied, they stay with this game.
+        """
+        game = type(self).__new__(type(self))
+        game.__dict__.update(self.__dict__)
+        game.bitboards = self.bitboards[:]
+        game.moves = self.moves[:]
+        game.trackers = {}
+        return game
+
     def play(self, i, j, player, color):
         """
             If the move is valid it plays it, otherwise raises relevant exception.
             Returns the lines of cells on the board captured by the move.
         """
-        if self.board[i][j] != 0:
+        if not (0 <= i < 8 and 0 <= j < 8):
+            raise InvalidMoveError("Square is outside the board.")
+        square = move_to_square(i, j)
+        own, opp = self.bitboards[player], self.bitboards[3 - player]
+        if (own | opp) & (1 << square):
             raise InvalidMoveError("Square is already taken.")
-        lines = find_lines(self.board, i, j, player)
+        lines = [mask_to_line(line, square) for line in get_flip_lines(own, opp, square)]
         if not lines:
             raise InvalidMoveError(f"{color} player isn't allowed to place a disk in this square.")
         self.play_move(i, j, lines, player)
         return lines
     
     def is_game_over(self):
-        return (
-            self.get_total_disk_count() == 64
-            or (
-                not get_possible_moves(self.board, 1)
-                and
-                not get_possible_moves(self.board, 2)
-            )
-        )
+        return self.empty_count == 0 or not (self.moves[1] | self.moves[2])
     
     def set_winner(self):
         if self.black_score > self.white_score:
@@ -194,7 +573,7 @@ class Game:
                 "Choose a move from: ",
                 set(
                     [move_to_notation(move[0], move[1], self.current_player)
-                    for move in list(get_possible_moves(self.board, self.current_player).keys())]
+                    for move in self.get_legal_moves(self.current_player)]
                 )
             )
                 
@@ -1,6 +1,5 @@
 from copy import deepcopy
-import random
-import time
+from Game.bitboard import *
 
 
 corners = [
@@ -18,6 +17,9 @@ very_bad_moves = [
     (1, 1), (1, 6), (6, 1), (6, 6)
 ]
 
+bad_moves_mask = sum(1 << (i * 8 + j) for i, j in bad_moves)
+very_bad_moves_mask = sum(1 << (i * 8 + j) for i, j in very_bad_moves)
+
 
 directions = [[1, 0], [1, 1], [1, -1], [0, 1], [-1, 1], [-1, -1], [-1, 0], [0, -1]]
 
@@ -40,6 +42,14 @@ weights_list = [
 
 timings_list = [0, 55, 56, 57, 58, 59, 60, 61, 62, 63]
 
+# Weights fitted by AI_Players.weight_fitting. The GUI's minimax player loads them instead of the
+# lists above when the file exists.
+realtime_weights_file = "realtime_weights.json"
+
+# Multi-ProbCut parameters fitted by AI_Players.probcut_fitting. The GUI's minimax player prunes
+# with them when the file exists.
+probcut_file = "probcut_params.json"
+
 
 square_static_weights = [
     [100, -10,  8,  6,  6,  8, -10, 100],
@@ -52,6 +62,15 @@ square_static_weights = [
     [100, -10,  8,  6,  6,  8, -10, 100]
 ]
 
+# square_static_weights indexed by square (bit index, see Game.bitboard).
+square_weights = [square_static_weights[i][j] for i in range(8) for j in range(8)]
+
+# (weight, mask) pairs, the mask holds all the squares with that weight in square_static_weights.
+square_weight_masks = [
+    (weight, sum(1 << (i * 8 + j) for i in range(8) for j in range(8) if square_static_weights[i][j] == weight))
+    for weight in sorted(set(w for row in square_static_weights for w in row))
+]
+
 
 class InvalidMoveError(RuntimeError): ...
 
@@ -65,27 +84,10 @@ def find_lines(board, i, j, player):
         plays row i and column j, and returns all these lines in a list.
         Lines can be vertical (up and down), horizontal (left to right and right to left) and diagonal.
     """
-    lines = []
-    # x_dir and y_dir are variables representing direction of lines on the x axis and y axis
-    for x_dir, y_dir in [[0, 1], [1, 1], [1, 0], [1, -1],
-                            [0, -1], [-1, -1], [-1, 0], [-1, 1]]:
-        line = []
-        cur_i = i + y_dir
-        cur_j = j + x_dir
-        found = False
-        while 0 <= cur_i < 8 and 0 <= cur_j < 8:
-            if board[cur_i][cur_j] == 0:
-                break
-            elif board[cur_i][cur_j] == player:
-                found = True
-                break
-            else:
-                line.append((cur_i,cur_j))
-                cur_i += y_dir
-                cur_j += x_dir
-        if found and line:
-            lines.append(line)
-    return lines
+    black, white = board_to_bitboards(board)
+    own, opp = (black, white) if player == 1 else (white, black)
+    square = move_to_square(i, j)
+    return [mask_to_line(line, square) for line in get_flip_lines(own, opp, square)]
 
 def get_possible_moves(board, player):
     """
@@ -95,13 +97,20 @@ def get_possible_moves(board, player):
         lines: a list of all uninterrupted lines of stones that would be captured if player
         plays row{i} and column{j}.
     """
+    black, white = board_to_bitboards(board)
+    own, opp = (black, white) if player == 1 else (white, black)
+    return get_possible_moves_from_bitboards(own, opp)
+
+def get_possible_moves_from_bitboards(own, opp):
+    """
+        Same as get_possible_moves, but for a position given as bitboards of the player and
+        the opponent.
+    """
     moves = {}
-    for i in range(8):
-        for j in range(8):
-            if board[i][j] == 0:
-                lines = find_lines(board, i, j, player)
-                if lines:
-                    moves[(i,j)] = lines
+    for square in iter_squares(get_moves_mask(own, opp)):
+        moves[square_to_move(square)] = [
+            mask_to_line(line, square) for line in get_flip_lines(own, opp, square)
+        ]
     return moves
 
 
@@ -136,6 +145,26 @@ def move_to_notation(i, j, player):
     notation += str(i + 1)
     return notation
 
+def transform_sequence(sequence, transform):
+    """
+        Applies a board transform (see Game.bitboard) to every move in a sequence of moves.
+    """
+    transformed = ""
+    for k in range(0, len(sequence), 2):
+        notation = sequence[k:k + 2]
+        i, j = notation_to_move(notation)
+        i, j = square_to_move(transform_square(move_to_square(i, j), transform))
+        transformed += move_to_notation(i, j, 1 if notation[0].isupper() else 2)
+    return transformed
+
+# Notations of every square for each player, indexed by [player][square]. The bit index of
+# square (i, j) is i * 8 + j.
+square_notations = [
+    None,
+    [move_to_notation(i, j, 1) for i in range(8) for j in range(8)],
+    [move_to_notation(i, j, 2) for i in range(8) for j in range(8)],
+]
+
 # ==============================================================================
 # ------- Functions for parsing opening sequences from the opening book --------
 
@@ -165,77 +194,6 @@ def get_openings_names():
     return names
 
 
-# ==============================================================
-# -- Functions for simulating a game
-
-def rollout(game, num_sims):
-    """
-        This function is a vital part of the MCTS algorithm.
-        It simulates random games from current state until terminal state.
-        game: the current state of the game that we run the simulations on.
-        num_sims: the number of games to be simulated.
-    """
-    turn = game.current_player
-    wins, draws, elapsed = 0, 0, 0
-
-    start = time.time()
-    for _ in range(num_sims):
-        temp_game = simulate_semi_randomly(game)
-        if temp_game.winner == turn:
-            wins += 1
-        if temp_game.winner == 0:
-            draws += 1
-
-    elapsed = time.time() - start
-    loss = num_sims - wins - draws
-
-    return wins, loss, draws, elapsed
-
-def simulate_randomly(state):
-    """
-        This is a function that simulates a random selection of moves in a game of Reversi.
-        This function is used by the rollout method of MonteCarloPlayer (MCTS algorithm)
-    """
-    new_state = deepcopy(state)
-    possible_moves = get_possible_moves(new_state.board, new_state.current_player)
-    while possible_moves:
-        random.seed(time.time())
-        move = random.choice(list(possible_moves.keys()))
-        new_state.play_move(move[0], move[1], possible_moves[move], new_state.current_player)
-        new_state.switch_player()
-        possible_moves = get_possible_moves(new_state.board, new_state.current_player)
-    new_state.switch_player()
-    if get_possible_moves(new_state.board, new_state.current_player):
-        return simulate_randomly(new_state)
-    return new_state
-
-def simulate_semi_randomly(state):
-    """
-        This is a function that simulates a semi random selection of moves in a game of Reversi.
-        It's semi random because when a random move is chosen, if it's adjacent to a corner in
-        any direction, we choose a new random move, if it's adjacent to a corner diagonally, we
-        choose a new random move.
-        This function is used by the rollout method of MonteCarloPlayer (MCTS algorithm)
-    """
-    new_state = deepcopy(state)
-    possible_moves = get_possible_moves(new_state.board, new_state.current_player)
-    while possible_moves:
-        random.seed(time.time())
-        move = random.choice(list(possible_moves.keys()))
-        if move in bad_moves or move in very_bad_moves:
-            move = random.choice(list(possible_moves.keys()))
-            if move in very_bad_moves:
-                move = random.choice(list(possible_moves.keys()))
-        new_state.play_move(move[0], move[1], possible_moves[move], new_state.current_player)
-        new_state.switch_player()
-        possible_moves = get_possible_moves(new_state.board, new_state.current_player)
-    new_state.switch_player()
-    if get_possible_moves(new_state.board, new_state.current_player):
-        return simulate_semi_randomly(new_state)
-    return new_state
-
-
-
 # ==============================================================================================
 # -------- Helper functions for realtime evaluator ---------------------------------------------
 
@@ -257,21 +215,15 @@ def get_frontier_squares(board, other_player):
 def get_stable_discs(board, player):
     """
         This function finds all the squares we occupy that cannot get captured by the opponent.
+        See get_stable_mask in Game.bitboard.
+    """
+    black, white = board_to_bitboards(board)
+    own, opp = (black, white) if player == 1 else (white, black)
+    return set(square_to_move(square) for square in iter_squares(get_stable_mask(own, opp)))
+
+def get_frontier_mask(other_bits, empty):
+    """
+        Same as get_frontier_squares, but on bitboards: the mask of all the empty squares next to
+        any square in other_bits.
     """
-    stable_discs = set()
-    for i, j in corners:
-        if board[i][j] == player:
-            # stable_discs.add((i, j))
-            for dir_y, dir_x in directions:
-                new_i = i + dir_y
-                new_j = j + dir_x
-                while (
-                    0 <= new_i <= 7
-                    and 0 <= new_j <= 7
-                    and board[new_i][new_j] == player
-                    and (new_i, new_j) not in stable_discs
-                ):
-                    stable_discs.add((new_i, new_j))
-                    new_i += dir_y
-                    new_j += dir_x
-    return stable_discs
+    return get_neighbours_mask(other_bits) & empty
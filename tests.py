@@ -1,3 +1,6 @@
+import json
+import os
+import tempfile
 import unittest
 from Game.game import *
 from AI_Players.ai_players import *
@@ -5,6 +8,22 @@ from GUI.graphics import Board
 from Game.util import *
 
 
+def play_first_moves(game, n, pick=min):
+    """
+        Plays n moves on game, each one the square pick chooses out of the list of the player to
+        move's squares (min, max, or random.choice for a random game). A player without moves
+        passes, and the moves stop when the game is over.
+    """
+    for _ in range(n):
+        moves = game.get_moves_mask(game.current_player)
+        if not moves:
+            game.switch_player()
+            moves = game.get_moves_mask(game.current_player)
+            if not moves:
+                return
+        game.make_move(pick(list(iter_squares(moves))))
+
+
 class Tests(unittest.TestCase):
     # =========================
     # -------- Testing gui's board
@@ -77,6 +96,16 @@ class Tests(unittest.TestCase):
         game = Game()
         result = board.play(game)
         self.assertIn(result, [0, 1, 2])
+
+    def test_board_game_without_pondering(self):
+        # AI players don't ponder on each other's time, they'd only slow each other down
+        p1, p2 = RandomPlayer(1), RandomPlayer(2)
+        calls = []
+        for player in [p1, p2]:
+            player.start_pondering = calls.append
+        board = Board(player1=p1, player2=p2)
+        board.play(Game())
+        self.assertEqual(calls, [])
     
     # ============================
     # --------- Testing game
@@ -128,7 +157,128 @@ class Tests(unittest.TestCase):
         self.assertEqual(game.move_sequence, move_to_notation(move[0], move[1], player))
         self.assertFalse(player == game.current_player)
         self.assertFalse(game.is_game_over())
-    
+        black, white = game.bitboards[1], game.bitboards[2]
+        self.assertEqual(game.moves, [0, get_moves_mask(black, white), get_moves_mask(white, black)])
+
+    def test_game_make_unmake_move(self):
+        game = Game()
+        states, undos = [], []
+        while not game.is_game_over():
+            moves = game.get_moves_mask(game.current_player)
+            if not moves:
+                game.switch_player()
+                continue
+            states.append((game.bitboards[:], game.get_score(), game.current_player, game.winner, game.move_sequence))
+            square = random.choice(list(iter_squares(moves)))
+            lines = game.get_possible_moves(game.current_player)[square_to_move(square)]
+            undos.append(game.make_move(square))
+            for line in lines:
+                for i, j in line:
+                    self.assertEqual(game.board[i][j], 3 - game.current_player)
+        self.assertIsNotNone(game.winner)
+        while undos:
+            game.unmake_move(undos.pop())
+            state = states.pop()
+            self.assertEqual((game.bitboards, game.get_score(), game.current_player, game.winner, game.move_sequence), state)
+
+    def find_lines_reference(self, board, i, j, player):
+        """
+            The list based find_lines the bitboards replaced, to check them against.
+        """
+        lines = []
+        for x_dir, y_dir in [[0, 1], [1, 1], [1, 0], [1, -1], [0, -1], [-1, -1], [-1, 0], [-1, 1]]:
+            line = []
+            cur_i, cur_j = i + y_dir, j + x_dir
+            while 0 <= cur_i < 8 and 0 <= cur_j < 8 and board[cur_i][cur_j] == 3 - player:
+                line.append((cur_i, cur_j))
+                cur_i += y_dir
+                cur_j += x_dir
+            if line and 0 <= cur_i < 8 and 0 <= cur_j < 8 and board[cur_i][cur_j] == player:
+                lines.append(line)
+        return lines
+
+    def test_bitboards_against_lists(self):
+        random.seed(11)
+        for _ in range(200):
+            board = [[random.choice([0, 0, 1, 2]) for _ in range(8)] for _ in range(8)]
+            black, white = board_to_bitboards(board)
+            self.assertEqual(bitboards_to_board(black, white), board)
+            for player in [1, 2]:
+                own, opp = (black, white) if player == 1 else (white, black)
+                moves = 0
+                for i in range(8):
+                    for j in range(8):
+                        if board[i][j]:
+                            continue
+                        lines = self.find_lines_reference(board, i, j, player)
+                        if lines:
+                            moves |= 1 << move_to_square(i, j)
+                            flips = line_to_mask([square for line in lines for square in line])
+                            self.assertEqual(get_flips(own, opp, move_to_square(i, j)), flips)
+                self.assertEqual(get_moves_mask(own, opp), moves)
+        game = Game()
+        with self.assertRaises(TypeError):
+            game.board[0][0] = 1
+
+    def test_game_moves_cache(self):
+        game = Game()
+        while not game.is_game_over():
+            black, white = game.bitboards[1], game.bitboards[2]
+            self.assertEqual(game.get_moves_mask(1), get_moves_mask(black, white))
+            self.assertEqual(game.get_moves_mask(2), get_moves_mask(white, black))
+            self.assertEqual(game.empty_count, 64 - popcount(black | white))
+            moves = game.get_possible_moves(game.current_player)
+            if not moves:
+                game.switch_player()
+                continue
+            move = random.choice(list(moves.keys()))
+            game.play_move(move[0], move[1], moves[move], game.current_player)
+        self.assertFalse(game.get_moves_mask(1) | game.get_moves_mask(2))
+
+    def test_game_zobrist_hash(self):
+        for _ in range(20):
+            game = Game()
+            undos, hashes = [], []
+            while not game.is_game_over():
+                self.assertEqual(game.get_hash(), zobrist_hash(game.bitboards[1], game.bitboards[2], game.current_player))
+                moves = game.get_moves_mask(game.current_player)
+                if not moves:
+                    game.switch_player()
+                    continue
+                hashes.append(game.get_hash())
+                undos.append(game.make_move(random.choice(list(iter_squares(moves)))))
+            self.assertEqual(game.get_hash(), zobrist_hash(game.bitboards[1], game.bitboards[2], game.current_player))
+            while undos:
+                game.unmake_move(undos.pop())
+                self.assertEqual(game.get_hash(), hashes.pop())
+        game = Game()
+        moves = game.get_possible_moves(1)
+        move = list(moves.keys())[0]
+        game.play_move(move[0], move[1], moves[move], 1)
+        self.assertEqual(game.get_hash(), zobrist_hash(game.bitboards[1], game.bitboards[2], 2))
+
+    def test_game_canonical_key(self):
+        game = Game()
+        play_first_moves(game, 20, pick=random.choice)
+        key, transform = game.get_canonical_key()
+        self.assertEqual(key[:2], get_symmetries(game.bitboards[1], game.bitboards[2])[transform])
+        for t in range(8):
+            black = transform_bitboard(game.bitboards[1], t)
+            white = transform_bitboard(game.bitboards[2], t)
+            symmetric_game = Game.from_bitboards(black, white, game.current_player)
+            self.assertEqual(symmetric_game.get_canonical_key()[0], key)
+            self.assertEqual(transform_bitboard(black, INVERSE_TRANSFORMS[t]), game.bitboards[1])
+
+    def test_ai_player_opening_move_in_any_orientation(self):
+        player = AIPlayer(2, "AI")
+        for first_move in ["C4", "D3", "E6", "F5"]:
+            game = Game()
+            i, j = notation_to_move(first_move)
+            game.play(i, j, 1, "Black")
+            move = player.get_opening_move(game)
+            self.assertIsNotNone(move)
+            self.assertIn(move, game.get_legal_moves(2))
+
     def test_game_set_winner(self):
         board1 = [
             [0, 0, 0, 0, 0, 0, 0, 0],
@@ -160,5 +310,537 @@ class Tests(unittest.TestCase):
         self.assertEqual(game2.winner, 2)
 
 
+    # ============================
+    # --------- Testing evaluators
+
+    def test_stable_discs(self):
+        game = Game()
+        self.assertEqual(get_stable_mask(game.bitboards[1], game.bitboards[2]), 0)
+        board = [
+            [1, 1, 1, 2, 0, 0, 0, 2],
+            [1, 1, 0, 0, 0, 0, 0, 2],
+            [1, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 2, 1, 0, 0, 0],
+            [0, 0, 0, 1, 2, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+        ]
+        self.assertEqual(get_stable_discs(board, 1), {(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (2, 0)})
+        self.assertEqual(get_stable_discs(board, 2), {(0, 7), (1, 7)})
+        full_board = [[1 if (i + j) % 3 else 2 for j in range(8)] for i in range(8)]
+        black, white = board_to_bitboards(full_board)
+        self.assertEqual(get_stable_mask(black, white), black)
+        self.assertEqual(get_final_score_bounds(black, white), (popcount(black) - popcount(white),) * 2)
+
+    def test_realtime_evaluator_fused_eval(self):
+        evaluator = RealtimeEvaluator()
+        for _ in range(30):
+            game = Game()
+            play_first_moves(game, random.randint(0, 60), pick=random.choice)
+            board = game.board
+            empty = ~(game.bitboards[1] | game.bitboards[2]) & FULL_MASK
+            for player in [1, 2]:
+                self.assertEqual(line_to_mask(get_frontier_squares(board, player)), get_frontier_mask(game.bitboards[player], empty))
+                self.assertEqual(line_to_mask(get_stable_discs(board, player)), get_stable_mask(game.bitboards[player], game.bitboards[3 - player]))
+                weights = evaluator.weights_for_disc_count[game.get_total_disk_count()]
+                expected = (weights[0] * evaluator.mobility_evaluation(game, player) +
+                            weights[1] * evaluator.frontier_evaluation(game, player) +
+                            weights[2] * evaluator.disc_difference(game, player) +
+                            weights[3] * evaluator.placement_evaluation(game, player) +
+                            weights[4] * evaluator.stability_evaluation(game, player) +
+                            weights[5] * evaluator.corner_grab_possibility(game, player))
+                self.assertEqual(evaluator.eval(game, player), expected)
+
+    def test_evaluators_eval_to_move(self):
+        evaluators = [StaticEvaluator(), DynamicEvaluator(), RealtimeEvaluator(), PatternEvaluator()]
+        random.seed(5)
+        for _ in range(20):
+            game = Game()
+            play_first_moves(game, random.randint(0, 50), pick=random.choice)
+            other = game.copy()
+            other.current_player = 3 - game.current_player
+            for evaluator in evaluators:
+                score = evaluator.eval_to_move(game)
+                self.assertAlmostEqual(score, -evaluator.eval_to_move(other))
+                player = game.current_player
+                self.assertAlmostEqual(score, (evaluator.eval(game, player) - evaluator.eval(game, 3 - player)) / 2)
+                if evaluator.antisymmetric:
+                    self.assertAlmostEqual(evaluator.eval(game, 1), -evaluator.eval(game, 2))
+        self.assertFalse(RealtimeEvaluator.antisymmetric)
+
+    def test_realtime_evaluator_fitted_weights(self):
+        from AI_Players.weight_fitting import fit_weights, get_interpolated_features, label_scale, save_weights
+        import numpy as np
+        import tempfile
+        features = np.array([[random.uniform(-100, 100) for _ in range(6)] for _ in range(500)])
+        disc_counts = np.array([random.randint(4, 64) for _ in range(500)])
+        timings = [0, 16, 32, 48, 64]
+        true_weights = np.array([random.uniform(-50, 50) for _ in range(6 * len(timings))])
+        labels = get_interpolated_features(features, disc_counts, timings) @ true_weights / label_scale
+        weights = fit_weights(features, labels, disc_counts, timings, regularization=0)
+        self.assertEqual(sum(weights, []), [round(w) for w in true_weights])
+        with tempfile.TemporaryDirectory() as folder:
+            path = f"{folder}/weights.json"
+            save_weights(weights, timings, path)
+            evaluator = RealtimeEvaluator(path)
+        self.assertEqual(evaluator.weights_for_disc_count[32], weights[2])
+        self.assertEqual(evaluator.weights_for_disc_count[40], [round((w + v) / 2) for w, v in zip(weights[2], weights[3])])
+
+    def test_pattern_evaluator_incremental_indexes(self):
+        evaluator = PatternEvaluator()
+        game = Game()
+        self.assertEqual(evaluator.eval(game, 1), 0)
+        undos = []
+        while not game.is_game_over():
+            moves = game.get_moves_mask(game.current_player)
+            if not moves:
+                game.switch_player()
+                continue
+            undos.append(game.make_move(random.choice(list(iter_squares(moves)))))
+            indexes = get_pattern_indexes(game.bitboards[1], game.bitboards[2])
+            self.assertEqual(evaluator.get_indexes(game), indexes)
+            self.assertEqual(evaluator.eval(game, 1), -evaluator.eval(game, 2))
+        while undos:
+            game.unmake_move(undos.pop())
+        self.assertEqual(evaluator.get_indexes(game), get_pattern_indexes(INITIAL_BLACK, INITIAL_WHITE))
+        self.assertEqual(game.copy().get_tracker("patterns"), None)
+        # The player searches a copy, so its evaluator's tracker isn't left on the game
+        game = Game()
+        play_first_moves(game, 12, pick=max)
+        player = MinimaxPlayer(game.current_player, evaluator=evaluator, depth=2)
+        player.find_move(game)
+        self.assertIsNone(game.get_tracker("patterns"))
+
+
+    # ============================
+    # --------- Testing min-max search
+
+    def test_transposition_table(self):
+        table = TranspositionTable(1)
+        self.assertLessEqual(table.size * tt_entry_size, 2 ** 20)
+        key = Game().get_hash()
+        self.assertIsNone(table.probe(key))
+        table.store(key, 4, exact_bound, 12.5, 19)
+        self.assertEqual(table.probe(key), (4, exact_bound, 12.5, 19))
+        # Keys of the same bucket: a shallower search goes to the always-replace slot and
+        # doesn't push out the deeper one.
+        other_key = key + table.bucket_mask + 1
+        third_key = other_key + table.bucket_mask + 1
+        table.store(other_key, 2, lower_bound, -3, -1)
+        table.store(third_key, 1, upper_bound, 7, 5)
+        self.assertEqual(table.probe(key), (4, exact_bound, 12.5, 19))
+        self.assertIsNone(table.probe(other_key))
+        self.assertEqual(table.probe(third_key), (1, upper_bound, 7, 5))
+        table.store(other_key, 6, exact_bound, 1, 0)
+        self.assertEqual(table.probe(other_key), (6, exact_bound, 1, 0))
+        self.assertIsNone(table.probe(key))
+        self.assertEqual(table.collisions, 2)
+        self.assertEqual(table.get_stats()["hits"], 4)
+        table.clear()
+        self.assertIsNone(table.probe(other_key))
+
+    def test_minimax_transposition_table(self):
+        game = Game()
+        play_first_moves(game, 8, pick=max)
+        player = MinimaxPlayer(game.current_player, evaluator=StaticEvaluator())
+        scores = []
+        for use_table in [False, True]:
+            player.transposition_table = TranspositionTable(1)
+            if not use_table:
+                player.transposition_table.probe = lambda key: None
+            scores.append(player.negamax(game, 4, float("-inf"), float("inf")))
+        self.assertEqual(scores[0], scores[1])
+        self.assertGreater(player.transposition_table.hits, 0)
+
+
+    def test_minimax_time_limit(self):
+        game = Game()
+        play_first_moves(game, 16)
+        self.assertIsNone(AIPlayer(game.current_player, "AI").get_opening_move(game))
+        bitboards = game.bitboards[:]
+        player = MinimaxPlayer(game.current_player, evaluator=RealtimeEvaluator(), time_limit=200)
+        start = time.perf_counter()
+        i, j = player.find_move(game)
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertTrue(game.get_moves_mask(game.current_player) & (1 << move_to_square(i, j)))
+        self.assertEqual(game.bitboards, bitboards)
+        self.assertIsNone(player.deadline)
+
+    def test_minimax_time_limit_principal_variation(self):
+        # Searches stopped by the time limit don't spoil the principal variation
+        random.seed(8)
+        for _ in range(5):
+            game = Game()
+            play_first_moves(game, random.randrange(16, 30), pick=random.choice)
+            if game.is_game_over() or not game.get_moves_mask(game.current_player):
+                continue
+            player = MinimaxPlayer(game.current_player, evaluator=RealtimeEvaluator(), time_limit=20)
+            player.find_move(game)
+            if player.stats.source != "search":
+                continue
+            replay = game.copy()
+            for key, square in player.principal_variation:
+                self.assertEqual(key, replay.get_hash())
+                self.assertTrue(replay.get_moves_mask(replay.current_player) >> square & 1)
+                replay.make_move(square)
+            self.assertEqual(player.stats.counters["principal_variation"], [square for _, square in player.principal_variation])
+
+
+    def test_minimax_move_ordering(self):
+        game = Game()
+        play_first_moves(game, 12, pick=max)
+        self.assertIsNone(AIPlayer(game.current_player, "AI").get_opening_move(game))
+        player = MinimaxPlayer(game.current_player, evaluator=StaticEvaluator(), depth=3)
+        squares = list(iter_squares(game.get_moves_mask(game.current_player)))
+        player.killers[game.empty_count] = [squares[1], -1]
+        order = player.order_moves(game, game.get_moves_mask(game.current_player), 3, squares[2])
+        self.assertEqual(order[:2], [squares[2], squares[1]])
+        self.assertEqual(sorted(order), squares)
+        moves, nodes = [], []
+        for move_ordering in [False, True]:
+            player = MinimaxPlayer(game.current_player, evaluator=StaticEvaluator(), depth=3, move_ordering=move_ordering)
+            moves.append(player.find_move(game))
+            nodes.append(player.nodes)
+        self.assertEqual(moves[0], moves[1])
+        self.assertLess(nodes[1], nodes[0])
+
+
+    def test_endgame_solver(self):
+        def final_disc_difference(own, opp):
+            moves = get_moves_mask(own, opp)
+            if not moves:
+                if not get_moves_mask(opp, own):
+                    return popcount(own) - popcount(opp)
+                return -final_disc_difference(opp, own)
+            return max(
+                -final_disc_difference(opp & ~flips, own | flips | (1 << square))
+                for square in iter_squares(moves) for flips in [get_flips(own, opp, square)]
+            )
+
+        solver = EndgameSolver()
+        for _ in range(5):
+            game = Game()
+            play_first_moves(game, game.empty_count - 7, pick=random.choice)
+            own, opp = game.bitboards[game.current_player], game.bitboards[3 - game.current_player]
+            if game.is_game_over() or not game.get_moves_mask(game.current_player):
+                continue
+            expected = final_disc_difference(own, opp)
+            self.assertEqual(solver.solve(own, opp), expected)
+            square, score = solver.solve_move(own, opp)
+            self.assertEqual(score, expected)
+            flips = get_flips(own, opp, square)
+            self.assertEqual(-final_disc_difference(opp & ~flips, own | flips | (1 << square)), expected)
+            _, wld_score = solver.solve_move(own, opp, wld=True)
+            self.assertEqual((wld_score > 0) - (wld_score < 0), (expected > 0) - (expected < 0))
+            player = MinimaxPlayer(game.current_player)
+            self.assertEqual(move_to_square(*player.find_move(game)), square)
+
+
+    def test_minimax_parallel_search(self):
+        game = Game()
+        play_first_moves(game, 14, pick=max)
+        self.assertIsNone(AIPlayer(game.current_player, "AI").get_opening_move(game))
+        moves = []
+        for workers in [1, 2]:
+            player = MinimaxPlayer(game.current_player, evaluator=StaticEvaluator(), depth=4, workers=workers)
+            moves.append(player.find_move(game))
+            # A copy doesn't take the running pool of processes along, it starts its own
+            self.assertIsNone(deepcopy(player).executor)
+            player.close()
+            self.assertIsNone(player.executor)
+        self.assertEqual(moves[0], moves[1])
+
+
+    def test_search_stats(self):
+        game = Game()
+        play_first_moves(game, 16)
+        player = MinimaxPlayer(game.current_player, evaluator=StaticEvaluator(), depth=3)
+        self.assertIsNone(player.stats)
+        streamed = []
+        with tempfile.TemporaryDirectory() as folder:
+            log_path = os.path.join(folder, "stats.jsonl")
+            player.set_stats_hook(streamed.append, log_path)
+            move = player.find_move(game)
+            with open(log_path) as f:
+                logged = [json.loads(line) for line in f]
+        stats = player.stats
+        self.assertEqual(streamed, [stats])
+        self.assertEqual(logged, [json.loads(json.dumps(stats.to_dict()))])
+        self.assertEqual(stats.move, move)
+        self.assertEqual(stats.source, "search")
+        self.assertEqual(stats.counters["depth"], 4)
+        self.assertEqual(stats.counters["nodes"], player.nodes)
+        self.assertGreater(stats.counters["cutoffs"], 0)
+        self.assertGreater(stats.counters["tt_probes"], 0)
+        self.assertGreaterEqual(stats.time, sum(stats.phase_times.values()))
+        player.set_stats_hook()
+        player.find_move(game)
+        self.assertEqual(len(streamed), 1)
+        player = RandomPlayer(game.current_player)
+        player.find_move(game)
+        self.assertEqual(player.stats.source, "random")
+
+    def test_minimax_probcut(self):
+        game = Game()
+        play_first_moves(game, 16)
+        with tempfile.TemporaryDirectory() as folder:
+            params_path = os.path.join(folder, "probcut.json")
+            pairs = [{"phase": phase, "depth": 3, "shallow_depth": 1, "a": 1.0, "b": 0.0, "sigma": 10.0}
+                     for phase in range(phase_count)]
+            with open(params_path, "w") as f:
+                json.dump({"pairs": pairs}, f)
+            probcut = ProbCut(params_path)
+        self.assertEqual(probcut.get_cut(game, 3), (1, 1.0, 0.0, 10.0))
+        self.assertIsNone(probcut.get_cut(game, 4))
+        nodes = []
+        for probcut in [None, probcut]:
+            player = MinimaxPlayer(game.current_player, evaluator=RealtimeEvaluator(), depth=4, probcut=probcut)
+            i, j = player.find_move(game)
+            self.assertTrue(game.get_moves_mask(game.current_player) & (1 << move_to_square(i, j)))
+            nodes.append(player.nodes)
+        self.assertLess(nodes[1], nodes[0])
+
+    def test_minimax_keep_tables(self):
+        game = Game()
+        play_first_moves(game, 16)
+        nodes = []
+        for keep_tables in [False, True]:
+            player = MinimaxPlayer(game.current_player, evaluator=RealtimeEvaluator(), depth=4, keep_tables=keep_tables)
+            move = player.find_move(game)
+            variation = player.principal_variation
+            self.assertEqual(square_to_move(variation[0][1]), move)
+            self.assertEqual(variation[0][0], game.get_hash())
+            next_game = game.copy()
+            next_game.make_move(variation[0][1])
+            next_game.make_move(variation[1][1])
+            self.assertEqual(player.get_principal_variation_move(next_game), variation[2][1])
+            player.find_move(next_game)
+            nodes.append(player.nodes)
+        self.assertLess(nodes[1], nodes[0])
+        self.assertEqual(player.transposition_table.age, 2)
+        # The scores in the tables are for the player to move, so they're kept when the player
+        # changes color the way Window.replay_game does it, and the other color's search uses them
+        reply_game = next_game.copy()
+        reply_game.make_move(player.principal_variation[0][1])
+        player.color = 3 - player.color
+        self.assertEqual(player.color, reply_game.current_player)
+        player.new_search()
+        self.assertEqual(player.transposition_table.age, 3)
+        self.assertIsNotNone(player.transposition_table.probe(reply_game.get_hash()))
+        fresh = MinimaxPlayer(player.color, evaluator=RealtimeEvaluator(), depth=4)
+        for searcher in [player, fresh]:
+            searcher.nodes = 0
+            searcher.negamax(reply_game, 4, float("-inf"), float("inf"))
+        self.assertLess(player.nodes, fresh.nodes)
+        # Without keep_tables everything is cleared
+        player.keep_tables = False
+        player.new_search()
+        self.assertEqual(player.transposition_table.probes, 0)
+        self.assertEqual(player.principal_variation, [])
+
+    def test_minimax_pondering(self):
+        game = Game()
+        play_first_moves(game, 15, pick=max)
+        player = MinimaxPlayer(3 - game.current_player, evaluator=RealtimeEvaluator(), time_limit=200, ponder=True)
+        # Count the positions pondering searches, apart from the nodes of an earlier search
+        player.nodes = 1000
+        searched = []
+        negamax = player.negamax
+        def counting_negamax(*args):
+            searched.append(None)
+            return negamax(*args)
+        player.negamax = counting_negamax
+        player.start_pondering(game)
+        time.sleep(0.3)
+        player.stop_pondering()
+        del player.negamax
+        ponder_nodes = len(searched)
+        self.assertIsNone(player.ponder_thread)
+        self.assertIsNone(player.deadline)
+        self.assertGreater(player.nodes, 0)
+        reply = next(iter_squares(game.get_moves_mask(game.current_player)))
+        game.make_move(reply)
+        self.assertIsNotNone(player.transposition_table.probe(game.get_hash()))
+        i, j = player.find_move(game)
+        self.assertTrue(game.get_moves_mask(game.current_player) & (1 << move_to_square(i, j)))
+        self.assertEqual(player.stats.counters["ponder_nodes"], ponder_nodes)
+        # Pondering is only done on the opponent's time
+        player.start_pondering(game)
+        self.assertIsNone(player.ponder_thread)
+
+    # ============================
+    # --------- Testing MCTS
+
+    def test_playout_alternates_players(self):
+        game = Game()
+        disc_difference = PlayoutEngine(seed=9).playout(game.bitboards[1], game.bitboards[2])
+        # Replay the playout on a game: a player only moves twice in a row when the other one passes
+        engine = PlayoutEngine(seed=9)
+        while not game.is_game_over():
+            moves = game.get_moves_mask(game.current_player)
+            if not moves:
+                game.switch_player()
+                continue
+            game.make_move(engine.choose_square(moves))
+        self.assertEqual(disc_difference, game.black_score - game.white_score)
+
+    def test_playout_engine(self):
+        game = Game()
+        play_first_moves(game, 10)
+        engines = [PlayoutEngine(seed=7), PlayoutEngine(seed=7)]
+        results = [engine.rollout(game, 50) for engine in engines]
+        self.assertEqual(results[0][:3], results[1][:3])
+        self.assertEqual(sum(results[0][:3]), 50)
+        self.assertEqual(engines[0].playouts, 50)
+        self.assertGreater(engines[0].get_playouts_per_second(), 0)
+        engine = engines[0]
+        while game.empty_count > 1:
+            moves = game.get_moves_mask(game.current_player)
+            if not moves:
+                game.switch_player()
+                continue
+            game.make_move(engine.choose_square(moves))
+        own, opp = game.bitboards[game.current_player], game.bitboards[3 - game.current_player]
+        self.assertEqual(engine.playout(own, opp), EndgameSolver().solve(own, opp))
+
+    def test_numpy_playout_engine(self):
+        engine = NumpyPlayoutEngine(seed=3)
+        np = engine.np
+        games = []
+        for seed in range(8):
+            random.seed(seed)
+            game = Game()
+            play_first_moves(game, random.randrange(4, 40), pick=random.choice)
+            games.append(game)
+        own = np.array([game.bitboards[game.current_player] for game in games], dtype=np.uint64)
+        opp = np.array([game.bitboards[3 - game.current_player] for game in games], dtype=np.uint64)
+        moves = engine.get_moves(own, opp)
+        self.assertEqual([int(mask) for mask in moves], [game.get_moves_mask(game.current_player) for game in games])
+        squares = engine.choose_squares(moves)
+        for k, game in enumerate(games):
+            if moves[k]:
+                self.assertTrue(int(moves[k]) >> int(squares[k]) & 1)
+        move_bits = engine.square_bits[squares]
+        flips = engine.get_flips(own, opp, move_bits)
+        for k in range(len(games)):
+            self.assertEqual(int(flips[k]), get_flips(int(own[k]), int(opp[k]), int(squares[k])))
+        wins, loss, draws, _ = engine.rollout(games[0], 300)
+        self.assertEqual(wins + loss + draws, 300)
+        player = MCTSPlayer(games[0].current_player, num_sims=64, max_iter=5, playouts="numpy")
+        self.assertIsInstance(player.playout_engine, NumpyPlayoutEngine)
+
+    def test_mcts_tree(self):
+        game = Game()
+        play_first_moves(game, 10)
+        tree = MCTSTree(max_nodes=200, capacity=4)
+        tree.new_root(game)
+        self.assertTrue(tree.expand(0))
+        moves = list(iter_squares(game.get_moves_mask(game.current_player)))
+        self.assertEqual([tree.move[child] for child in tree.get_children(0)], moves)
+        for child, square in zip(tree.get_children(0), moves):
+            child_game = game.copy()
+            child_game.make_move(square)
+            self.assertEqual(tree.get_game(child).bitboards, child_game.bitboards)
+            self.assertEqual(tree.player[child], child_game.current_player)
+        # Grow the tree with made up results until it's full
+        random.seed(2)
+        leaves = list(tree.get_children(0))
+        while leaves:
+            node = leaves.pop(random.randrange(len(leaves)))
+            tree.back_propagate(node, random.randrange(3), random.randrange(3), 2)
+            if tree.expand(node):
+                leaves.extend(tree.get_children(node))
+        self.assertLessEqual(tree.size, 200)
+        self.assertEqual(tree.played[0], sum(tree.played[child] for child in tree.get_children(0)))
+        child = max(tree.get_children(0), key=lambda node: tree.child_count[node])
+        child_game = tree.get_game(child)
+        played = tree.played[child]
+        grandchildren = [(tree.move[node], tree.played[node], tree.wins[node]) for node in tree.get_children(child)]
+        tree.reroot(child)
+        self.assertEqual(tree.parent[0], -1)
+        self.assertEqual(tree.played[0], played)
+        self.assertEqual(tree.get_game(0).bitboards, child_game.bitboards)
+        self.assertEqual([(tree.move[node], tree.played[node], tree.wins[node]) for node in tree.get_children(0)], grandchildren)
+        for node in range(1, tree.size):
+            self.assertIn(node, tree.get_children(tree.parent[node]))
+
+    def test_mcts_node_budget(self):
+        game = Game()
+        play_first_moves(game, 10)
+        player = MCTSPlayer(game.current_player, num_sims=1, max_iter=600, seed=4, max_nodes=300)
+        player.find_move(game)
+        counters = player.stats.counters
+        self.assertGreater(counters["prunes"], 0)
+        self.assertGreater(counters["pruned_nodes"], 0)
+        self.assertLessEqual(counters["tree_size"], 300)
+        # Pruning keeps the statistics of the nodes that stay, the dropped games included
+        tree = MCTSTree(max_nodes=300)
+        tree.new_root(game)
+        leaves = [0]
+        random.seed(1)
+        while tree.size + max_children <= tree.max_nodes:
+            node = leaves.pop(random.randrange(len(leaves)))
+            tree.back_propagate(node, 1, 0, 1)
+            if tree.expand(node):
+                leaves.extend(tree.get_children(node))
+        root_children = [(tree.move[node], tree.played[node], tree.wins[node]) for node in tree.get_children(0)]
+        size = tree.size
+        self.assertTrue(tree.make_room())
+        self.assertLessEqual(tree.size, 150)
+        self.assertEqual((tree.prunes, tree.pruned_nodes), (1, size - tree.size))
+        self.assertEqual([(tree.move[node], tree.played[node], tree.wins[node]) for node in tree.get_children(0)], root_children)
+        for node in range(1, tree.size):
+            self.assertIn(node, tree.get_children(tree.parent[node]))
+        self.assertFalse(tree.make_room())
+        with self.assertRaises(ValueError):
+            MCTSTree(max_nodes=100)
+
+    def test_mcts_tree_reuse(self):
+        game = Game()
+        play_first_moves(game, 15, pick=max)
+        player = MCTSPlayer(game.current_player, num_sims=4, max_iter=60, seed=5)
+        i, j = player.find_move(game)
+        self.assertFalse(player.stats.counters["reused"])
+        game.make_move(move_to_square(i, j))
+        tree = player.tree
+        self.assertEqual(tree.parent[0], -1)
+        self.assertEqual(tree.get_game(0).bitboards, game.bitboards)
+        replies = [child for child in tree.get_children(0) if tree.child_count[child]]
+        self.assertTrue(replies)
+        reply = max(replies, key=lambda child: tree.played[child])
+        game.make_move(tree.move[reply])
+        played = tree.played[reply]
+        player.find_move(game)
+        self.assertTrue(player.stats.counters["reused"])
+        self.assertEqual(player.stats.counters["reused_played"], played)
+        # A position that isn't in the tree starts a new one
+        player.find_move(game)
+        self.assertFalse(player.stats.counters["reused"])
+
+    def test_mcts_pondering(self):
+        game = Game()
+        play_first_moves(game, 15, pick=max)
+        player = MCTSPlayer(3 - game.current_player, num_sims=2, max_iter=20, ponder=True)
+        player.start_pondering(game)
+        time.sleep(0.3)
+        player.stop_pondering()
+        tree = player.tree
+        self.assertEqual(tree.get_game(0).bitboards, game.bitboards)
+        reply = max(tree.get_children(0), key=lambda child: tree.played[child])
+        expanded = tree.child_count[reply] > 0
+        played = tree.played[reply]
+        game.make_move(tree.move[reply])
+        if expanded:
+            self.assertEqual(player.get_reused_root(game), 0)
+            self.assertEqual(tree.played[0], played)
+        else:
+            self.assertIsNone(player.get_reused_root(game))
+            self.assertEqual(tree.size, 0)
+        i, j = player.find_move(game)
+        self.assertTrue(game.get_moves_mask(game.current_player) & (1 << move_to_square(i, j)))
+        self.assertGreater(player.stats.counters["tree_size"], 1)
+        self.assertEqual(player.stats.counters["rollouts"], 2 * player.stats.counters["iterations"])
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file